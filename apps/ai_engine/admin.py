@@ -1,3 +1,15 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MemberRecommendation, MemberTaste
+
+
+@admin.register(MemberRecommendation)
+class MemberRecommendationAdmin(admin.ModelAdmin):
+    list_display = ("member", "generation", "updated_at")
+    readonly_fields = ("created_at", "updated_at")
+
+
+@admin.register(MemberTaste)
+class MemberTasteAdmin(admin.ModelAdmin):
+    list_display = ("member", "book_count", "updated_at")
+    readonly_fields = ("created_at", "updated_at")
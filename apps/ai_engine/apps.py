@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AiEngineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ai_engine'
+
+    def ready(self):
+        if getattr(settings, "EMBEDDING_WARM_UP", False):
+            from .encoder import warm_up
+
+            warm_up()
@@ -0,0 +1,195 @@
+"""
+Item-item collaborative filtering from ``BookIssue`` co-borrowing.
+
+Borrowing history becomes a sparse binary ``members x books`` matrix ``X``.
+The similarity of two books is the cosine of their columns, i.e. members
+in common over ``sqrt(borrowers_a * borrowers_b)``. ``X.T @ X`` is never
+materialised: rows are computed ``block`` books at a time and only the
+``top_n`` best neighbours of each book are kept, in ``BookNeighbour``.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils.timezone import now
+from scipy import sparse
+
+from apps.library.models import BookIssue
+from .models import BookNeighbour, NeighbourRefresh
+
+
+class Interactions:
+    """Binary borrowing matrix plus the id <-> column mappings."""
+
+    def __init__(self, member_ids, book_ids, matrix):
+        self.member_ids = member_ids
+        self.book_ids = book_ids
+        self.matrix = matrix.tocsr()
+        self.by_book = self.matrix.T.tocsr()
+        self.borrowers = np.diff(self.by_book.indptr).astype(np.float32)
+
+    @classmethod
+    def load(cls, loans=None, chunk_size=50_000):
+        """
+        Stream ``(member, book)`` pairs of ``loans`` (default: every loan);
+        memory is O(distinct pairs).
+        """
+        loans = BookIssue.objects.all() if loans is None else loans
+        pairs = loans.values_list("member_id", "book_id").iterator(chunk_size=chunk_size)
+        flat = np.fromiter((value for pair in pairs for value in pair), dtype=np.int64)
+        members, books = flat[0::2], flat[1::2]
+
+        member_ids, rows = np.unique(members, return_inverse=True)
+        book_ids, cols = np.unique(books, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(member_ids), len(book_ids)),
+        )
+        matrix.data[:] = 1.0  # repeat loans count once
+        return cls(member_ids, book_ids, matrix)
+
+    @classmethod
+    def load_around(cls, book_ids, chunk_size=50_000):
+        """
+        Just what the neighbour lists of ``book_ids`` depend on: the loans of
+        members who borrowed any of them, plus every book's total borrower
+        count (from the whole history, so scores match a full ``load``).
+        """
+        members = BookIssue.objects.filter(book_id__in=book_ids).values("member_id")
+        loans = BookIssue.objects.filter(member_id__in=members)
+        interactions = cls.load(loans, chunk_size=chunk_size)
+
+        borrowers = dict(
+            BookIssue.objects
+            .filter(book_id__in=loans.values("book_id"))
+            .values_list("book_id")
+            .annotate(count=Count("member_id", distinct=True))
+        )
+        interactions.borrowers = np.array(
+            [borrowers[book_id] for book_id in interactions.book_ids.tolist()], dtype=np.float32,
+        )
+        return interactions
+
+    def columns(self, book_ids):
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        cols = np.minimum(np.searchsorted(self.book_ids, book_ids), max(len(self.book_ids) - 1, 0))
+        return cols[self.book_ids[cols] == book_ids] if len(self.book_ids) else cols[:0]
+
+    def neighbours(self, cols, top_n=50, block=1024):
+        """Yield ``(book_id, neighbour_ids, scores)`` for the given columns."""
+        for start in range(0, len(cols), block):
+            chunk = cols[start:start + block]
+            similar = (self.by_book[chunk] @ self.matrix).tocsr()
+
+            for row, col in enumerate(chunk):
+                lo, hi = similar.indptr[row], similar.indptr[row + 1]
+                others = similar.indices[lo:hi]
+                counts = similar.data[lo:hi]
+
+                keep = others != col
+                others, counts = others[keep], counts[keep]
+                if not len(others):
+                    continue
+
+                scores = counts / np.sqrt(self.borrowers[col] * self.borrowers[others])
+                if len(scores) > top_n:
+                    best = np.argpartition(-scores, top_n - 1)[:top_n]
+                    others, scores = others[best], scores[best]
+                yield self.book_ids[col], self.book_ids[others], scores
+
+
+def _neighbour_rows(interactions, cols, top_n, block):
+    for book_id, neighbour_ids, scores in interactions.neighbours(cols, top_n=top_n, block=block):
+        for neighbour_id, score in zip(neighbour_ids.tolist(), scores.tolist()):
+            yield BookNeighbour(book_id=book_id, neighbour_id=neighbour_id, score=score)
+
+
+def _write(rows, batch_size=5000, upsert=False):
+    batch = []
+    written = 0
+    options = {}
+    if upsert:
+        options = {
+            "update_conflicts": True,
+            "unique_fields": ["book", "neighbour"],
+            "update_fields": ["score"],
+        }
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            BookNeighbour.objects.bulk_create(batch, **options)
+            written += len(batch)
+            batch = []
+    if batch:
+        BookNeighbour.objects.bulk_create(batch, **options)
+        written += len(batch)
+    return written
+
+
+def _mark_refreshed(started):
+    NeighbourRefresh.objects.update_or_create(pk=1, defaults={"since": started})
+
+
+def build_item_neighbours(top_n=None, block=1024):
+    """Full rebuild of ``BookNeighbour``. Returns the number of rows written."""
+    top_n = top_n or settings.RECOMMENDATION_CF_NEIGHBOURS
+    started = now()
+    interactions = Interactions.load()
+    cols = np.arange(len(interactions.book_ids))
+
+    with transaction.atomic():
+        BookNeighbour.objects.all().delete()
+        written = _write(_neighbour_rows(interactions, cols, top_n, block))
+        _mark_refreshed(started)
+    return written
+
+
+def refresh_item_neighbours(top_n=None, block=1024):
+    """
+    Incremental update: recompute the neighbour lists of books borrowed
+    since the last run from the loans of the members who borrowed them, and
+    upsert the reverse pairs so their neighbours see them too. Lists can
+    then exceed ``top_n`` until the next full rebuild trims them. Falls
+    back to a full rebuild on the first run.
+    """
+    top_n = top_n or settings.RECOMMENDATION_CF_NEIGHBOURS
+    since = NeighbourRefresh.objects.filter(pk=1).values_list("since", flat=True).first()
+    if since is None:
+        return build_item_neighbours(top_n=top_n, block=block)
+
+    started = now()
+    touched = list(
+        BookIssue.objects.filter(created_at__gte=since).values_list("book_id", flat=True).distinct()
+    )
+    if not touched:
+        _mark_refreshed(started)
+        return 0
+
+    interactions = Interactions.load_around(touched)
+    cols = interactions.columns(touched)
+    rows = list(_neighbour_rows(interactions, cols, top_n, block))
+    reverse = [
+        BookNeighbour(book_id=row.neighbour_id, neighbour_id=row.book_id, score=row.score)
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        BookNeighbour.objects.filter(book_id__in=touched).delete()
+        written = _write(rows)
+        written += _write(reverse, upsert=True)
+        _mark_refreshed(started)
+    return written
+
+
+def collaborative_scores(book_ids, limit=None):
+    """
+    Summed neighbour similarity of every book related to the first
+    ``limit`` (default RECOMMENDATION_HISTORY_SIZE) of ``book_ids``
+    (typically a member's most recent loans), as ``{book_id: score}``.
+    """
+    limit = limit or settings.RECOMMENDATION_HISTORY_SIZE
+    scores = {}
+    rows = BookNeighbour.objects.filter(book_id__in=list(book_ids)[:limit]).values_list("neighbour_id", "score")
+    for neighbour_id, score in rows:
+        scores[neighbour_id] = scores.get(neighbour_id, 0.0) + score
+    return scores
@@ -0,0 +1,117 @@
+"""
+Binary storage format for ``Book.embedding``.
+
+Layout (little endian)::
+
+    magic     4s   b"LEMB"
+    version   B    FORMAT_VERSION
+    dtype     B    1 = float32, 2 = float16
+    model_len H    length of the utf-8 model id
+    dim       I    number of components
+    model_id       ``model_len`` bytes, then zero padding to an 8 byte boundary
+    data           ``dim`` contiguous values of ``dtype``
+
+Decoding is a header parse plus ``np.frombuffer``; the vector is a read-only
+view on the stored bytes, nothing is copied or unpickled.
+"""
+import io
+import pickle
+import struct
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b"LEMB"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sBBHI")
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+EmbeddingHeader = namedtuple("EmbeddingHeader", "version dtype dim model_id offset")
+
+
+def default_model_id():
+    return getattr(settings, "EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+
+def default_dtype():
+    return getattr(settings, "EMBEDDING_STORAGE_DTYPE", "float32")
+
+
+def encode_embedding(vector, model_id=None, dtype=None):
+    dtype = np.dtype(dtype or default_dtype()).newbyteorder("<")
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    model = (model_id or default_model_id()).encode("utf-8")
+    data = np.ascontiguousarray(np.asarray(vector).reshape(-1), dtype=dtype)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _DTYPE_CODES[dtype], len(model), data.size)
+    padding = -(len(header) + len(model)) % 8
+    return b"".join((header, model, b"\0" * padding, data.tobytes()))
+
+
+def is_encoded(blob):
+    return blob is not None and bytes(blob[:4]) == MAGIC
+
+
+def read_header(blob):
+    if len(blob) < _HEADER.size:
+        raise ValueError("Embedding blob is truncated")
+
+    magic, version, dtype_code, model_len, dim = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded embedding (run `manage.py migrate_embeddings`)")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version: {version}")
+    if dtype_code not in _DTYPES:
+        raise ValueError(f"Unsupported embedding dtype code: {dtype_code}")
+
+    start = _HEADER.size
+    model_id = bytes(blob[start:start + model_len]).decode("utf-8")
+    offset = start + model_len
+    offset += -offset % 8
+    return EmbeddingHeader(version, _DTYPES[dtype_code], dim, model_id, offset)
+
+
+def decode_embedding(blob):
+    header = read_header(blob)
+    return np.frombuffer(blob, dtype=header.dtype, count=header.dim, offset=header.offset)
+
+
+class _NumpyUnpickler(pickle.Unpickler):
+    """Only rebuilds plain numpy arrays; anything else in the stream is refused."""
+
+    ALLOWED = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+        ("numpy.core.multiarray", "scalar"),
+        ("numpy._core.multiarray", "scalar"),
+        # Protocol 5 (the default from Python 3.14) rebuilds from a buffer.
+        ("numpy.core.numeric", "_frombuffer"),
+        ("numpy._core.numeric", "_frombuffer"),
+        # Protocols 0-2 carry the array bytes as latin-1 text.
+        ("_codecs", "encode"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name}")
+        return super().find_class(module, name)
+
+
+def normalize(vectors):
+    """L2-normalise along the last axis as float32; zero vectors stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_legacy_embedding(blob):
+    """Read an embedding written by the old ``pickle.dumps(array)`` format."""
+    return np.asarray(_NumpyUnpickler(io.BytesIO(bytes(blob))).load())
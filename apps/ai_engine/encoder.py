@@ -0,0 +1,118 @@
+"""
+In-process access to the sentence-transformer model.
+
+torch, transformers and sentence_transformers are only imported the first
+time something is encoded, so migrate, shell and workers that never embed
+do not pay for them. Processes that will embed can call ``warm_up()`` at
+start (or set EMBEDDING_WARM_UP) to move that cost out of the first request.
+
+With EMBEDDING_SERVICE_ADDRESS set, ``encode_texts`` goes through the shared
+embedding service first and only loads a local model if it is unreachable.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .service import remote_encode
+
+_model = None
+_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+
+    if _model is None:
+        with _lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def is_loaded():
+    return _model is not None
+
+
+def warm_up():
+    model = get_model()
+    model.encode(["warm up"])
+    return model
+
+
+def encode_texts(texts, batch_size=None):
+    """Encode a list of texts into a ``(len(texts), dim)`` float32 array."""
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    vectors = remote_encode(texts)
+    if vectors is not None:
+        return vectors
+
+    return get_model().encode(
+        texts,
+        batch_size=batch_size or settings.EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+    )
+
+
+class QueryCache:
+    """Thread-safe LRU of normalised query text -> read-only vector."""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+_query_cache = None
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+def encode_query(text):
+    """
+    Encode a search query, reusing the vector of any earlier query with the
+    same normalised text.
+    """
+    global _query_cache
+
+    if _query_cache is None:
+        _query_cache = QueryCache(getattr(settings, "SEMANTIC_SEARCH_QUERY_CACHE_SIZE", 2048))
+
+    key = normalize_query(text)
+    vector = _query_cache.get(key)
+    if vector is None:
+        vector = np.array(encode_texts([key])[0], dtype=np.float32)
+        _query_cache.put(key, vector)
+    return vector
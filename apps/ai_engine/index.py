@@ -0,0 +1,545 @@
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.utils import bump_counter, read_counter, schedule_once
+from apps.library.models import Book
+from .embeddings import decode_embedding, is_encoded, normalize
+from .quantization import QuantizedMatrix
+from .recommender import IVFIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_GENERATION_KEY = "ai_engine:embedding_index:generation"
+INDEX_PATCH_KEY = "ai_engine:embedding_index:patch:{}"
+MAX_PATCH_SPAN = 50
+AVAILABILITY_VERSION_KEY = "ai_engine:availability:version"
+AVAILABILITY_PATCH_KEY = "ai_engine:availability:patch:{}"
+MAX_AVAILABILITY_SPAN = 500
+MANIFEST_NAME = "manifest.json"
+REPUBLISH_SCHEDULED_KEY = "ai_engine:embedding_index:republish_scheduled"
+
+
+def current_generation():
+    return read_counter(INDEX_GENERATION_KEY)
+
+
+def bump_generation():
+    """
+    Mark every process' in-memory index as stale.
+
+    The generation lives in Django's cache so that, with a shared backend
+    (Redis), a change made by one worker is seen by all of them.
+    """
+    generation = bump_counter(INDEX_GENERATION_KEY)
+    schedule_republish()
+    return generation
+
+
+def patch_index(book_ids):
+    """
+    Like ``bump_generation`` but records which books changed, so workers
+    re-read just those rows instead of rebuilding the whole index.
+    """
+    generation = bump_generation()
+    cache.set(
+        INDEX_PATCH_KEY.format(generation),
+        sorted(set(book_ids)),
+        timeout=getattr(settings, "EMBEDDING_INDEX_PATCH_TTL", 3600),
+    )
+    return generation
+
+
+def schedule_republish():
+    """
+    With a published index (EMBEDDING_INDEX_DIR), queue a coalesced
+    ``republish_embedding_index`` run so the shared files catch up with
+    the change; workers only ever read the files.
+    """
+    if shared_index_dir() is None:
+        return
+    from .tasks import republish_embedding_index
+
+    schedule_once(REPUBLISH_SCHEDULED_KEY, republish_embedding_index, settings.EMBEDDING_INDEX_REPUBLISH_DELAY)
+
+
+def _changed_since(old_generation, new_generation):
+    """Book ids patched between two generations, or ``None`` if unknown."""
+    if not 0 <= new_generation - old_generation <= MAX_PATCH_SPAN:
+        return None
+    keys = [INDEX_PATCH_KEY.format(g) for g in range(old_generation + 1, new_generation + 1)]
+    patches = cache.get_many(keys)
+    if len(patches) != len(keys):
+        return None
+    return sorted({book_id for ids in patches.values() for book_id in ids})
+
+
+def availability_version():
+    return read_counter(AVAILABILITY_VERSION_KEY)
+
+
+def mark_availability(book_id, available):
+    """
+    Record that a book ran out of copies or got one back. Workers apply
+    these to their index's availability mask without rebuilding it, and
+    without bumping the index generation (which would also drop every
+    cached recommendation).
+    """
+    version = bump_counter(AVAILABILITY_VERSION_KEY)
+    cache.set(
+        AVAILABILITY_PATCH_KEY.format(version),
+        (book_id, bool(available)),
+        timeout=getattr(settings, "EMBEDDING_INDEX_PATCH_TTL", 3600),
+    )
+    return version
+
+
+def _read_vectors(queryset, chunk_size=2000):
+    """Ids, vectors, category ids and availability of books with an embedding."""
+    ids, vectors, categories, available = [], [], [], []
+    legacy = 0
+    rows = (
+        queryset
+        .exclude(embedding__isnull=True)
+        .order_by("id")
+        .values_list("id", "embedding", "category_id", "available_copies")
+        .iterator(chunk_size=chunk_size)
+    )
+    for book_id, blob, category_id, copies in rows:
+        if not is_encoded(blob):
+            legacy += 1
+            continue
+        ids.append(book_id)
+        vectors.append(decode_embedding(blob))
+        categories.append(category_id)
+        available.append(copies > 0)
+
+    if legacy:
+        logger.warning(
+            "Skipped %d books with legacy pickled embeddings; "
+            "run `manage.py migrate_embeddings`.", legacy
+        )
+    return (
+        ids,
+        vectors,
+        np.asarray(categories, dtype=np.int64),
+        np.asarray(available, dtype=bool),
+    )
+
+
+class EmbeddingIndex:
+    """
+    All book embeddings held as one L2-normalised float32 matrix.
+
+    Row ``i`` of ``matrix`` belongs to the book whose id is ``ids[i]``, so a
+    whole catalogue is scored with a single matrix-vector product. ``ids`` is
+    sorted, which lets rows be located by binary search instead of a
+    per-process dict, and lets both arrays be memory-mapped from disk.
+
+    When ``ann`` holds an ``IVFIndex`` over the same vectors, searches go
+    through it instead of scanning every row. Otherwise, when ``scan`` holds
+    a ``QuantizedMatrix`` copy, the scan reads that and only the best
+    candidates are re-scored from ``matrix``; with a memory-mapped index the
+    full-precision rows then mostly stay on disk.
+
+    ``categories`` and ``available`` are aligned with the rows so searches
+    can be restricted with a boolean mask (``filter_mask``) at the cost of
+    one vectorised comparison, instead of filtering results afterwards.
+    ``available`` is kept current from ``mark_availability`` patches.
+    """
+
+    def __init__(self, ids, matrix, generation=0, ann=None, scan=None,
+                 categories=None, available=None, availability_version=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.generation = generation
+        self.ann = ann
+        self.scan = scan
+        self.categories = (
+            np.asarray(categories, dtype=np.int64) if categories is not None
+            else np.zeros(len(self.ids), dtype=np.int64)
+        )
+        self.available = (
+            np.array(available, dtype=bool) if available is not None
+            else np.ones(len(self.ids), dtype=bool)
+        )
+        self.availability_version = availability_version
+        self._availability_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    @classmethod
+    def build(cls, generation=0, chunk_size=2000):
+        # Read the version first: patches landing during the scan are
+        # re-applied later, which is harmless.
+        version = availability_version()
+        ids, vectors, categories, available = _read_vectors(Book.objects.all(), chunk_size=chunk_size)
+        if not vectors:
+            return cls(ids, np.empty((0, 0), dtype=np.float32), generation, availability_version=version)
+        return cls(
+            ids,
+            normalize(np.vstack(vectors)),
+            generation,
+            categories=categories,
+            available=available,
+            availability_version=version,
+        ).quantized()
+
+    def quantized(self, kind=None):
+        """
+        Attach a compressed scan matrix of ``kind`` ("int8" or "float16",
+        default settings.EMBEDDING_INDEX_QUANTIZATION) and return ``self``.
+        """
+        kind = kind or getattr(settings, "EMBEDDING_INDEX_QUANTIZATION", None)
+        if kind and len(self):
+            self.scan = QuantizedMatrix.from_vectors(self.matrix, kind)
+        return self
+
+    def patched(self, book_ids, generation):
+        """
+        A copy with ``book_ids`` re-read from the database: changed vectors
+        are replaced, new books inserted and books without one dropped, in
+        the IVF index too (through its delta buffer) when there is one.
+        """
+        if not len(self):
+            return self.build(generation=generation)
+
+        ids, vectors, categories, available = _read_vectors(Book.objects.filter(id__in=book_ids))
+
+        keep = ~np.isin(self.ids, np.asarray(book_ids, dtype=np.int64))
+        all_ids = np.concatenate([self.ids[keep], np.asarray(ids, dtype=np.int64)])
+        categories = np.concatenate([self.categories[keep], categories])
+        available = np.concatenate([self.available[keep], available])
+        matrix = self.matrix[keep]
+        ann = None
+        if self.ann is not None:
+            # add/remove rebind the IVF arrays rather than write into them, so
+            # a shallow copy leaves the index other threads are reading intact.
+            ann = copy.copy(self.ann)
+            ann.remove(book_ids)
+        if vectors:
+            added = normalize(np.vstack(vectors))
+            matrix = np.concatenate([matrix, added])
+            if ann is not None:
+                ann.add(ids, added)
+
+        order = np.argsort(all_ids, kind="stable")
+        patched = self.__class__(
+            all_ids[order],
+            matrix[order],
+            generation,
+            ann=ann,
+            categories=categories[order],
+            available=available[order],
+            availability_version=self.availability_version,
+        )
+        return patched.quantized(self.scan.kind) if self.scan is not None else patched
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "vectors.npy", np.ascontiguousarray(self.matrix, dtype=np.float32))
+        np.save(directory / "ids.npy", self.ids)
+        np.save(directory / "categories.npy", self.categories)
+        np.save(directory / "available.npy", self.available)
+        if self.ann is not None:
+            self.ann.save(directory / "ivf")
+        if self.scan is not None:
+            self.scan.save(directory / "scan")
+
+    @classmethod
+    def load(cls, directory, generation=0, mmap=True):
+        """
+        Open a saved index. With ``mmap`` the arrays are read-only views on
+        the files, so every process shares one copy through the page cache.
+        The availability mask is private and refreshed from the database on
+        first use, since it will have drifted since the export.
+        """
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        ann = None
+        if (directory / "ivf").is_dir():
+            ann = IVFIndex.load(
+                directory / "ivf",
+                nprobe=getattr(settings, "EMBEDDING_ANN_NPROBE", None),
+                mmap=mmap,
+            )
+        scan = None
+        if (directory / "scan").is_dir():
+            scan = QuantizedMatrix.load(directory / "scan", mmap=mmap)
+        return cls(
+            np.load(directory / "ids.npy", mmap_mode=mode),
+            np.load(directory / "vectors.npy", mmap_mode=mode),
+            generation,
+            ann=ann,
+            scan=scan,
+            categories=np.load(directory / "categories.npy", mmap_mode=mode),
+            available=np.load(directory / "available.npy"),
+        )
+
+    def positions(self, book_ids):
+        """Matrix rows for ``book_ids``; ids without an embedding are skipped."""
+        book_ids = np.asarray(book_ids, dtype=np.int64).reshape(-1)
+        if not len(self) or not len(book_ids):
+            return np.empty(0, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, book_ids), len(self.ids) - 1)
+        return rows[self.ids[rows] == book_ids]
+
+    def lookup(self, flags, book_ids):
+        """``flags`` (one per row) for each of ``book_ids``; ``False`` if not indexed."""
+        book_ids = np.asarray(book_ids, dtype=np.int64).reshape(-1)
+        if not len(self) or not len(book_ids):
+            return np.zeros(len(book_ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(self.ids, book_ids), len(self.ids) - 1)
+        return flags[rows] & (self.ids[rows] == book_ids)
+
+    def refresh_availability(self):
+        """Apply ``mark_availability`` patches, or reload the mask if they expired."""
+        version = availability_version()
+        if version == self.availability_version:
+            return
+
+        with self._availability_lock:
+            if version == self.availability_version:
+                return
+            patches = None
+            since = self.availability_version
+            if since is not None and 0 < version - since <= MAX_AVAILABILITY_SPAN:
+                keys = [AVAILABILITY_PATCH_KEY.format(v) for v in range(since + 1, version + 1)]
+                found = cache.get_many(keys)
+                if len(found) == len(keys):
+                    patches = [found[key] for key in keys]
+
+            if patches is None:
+                unavailable = Book.objects.filter(available_copies=0).values_list("id", flat=True)
+                available = np.ones(len(self), dtype=bool)
+                available[self.positions(list(unavailable))] = False
+                self.available = available
+            else:
+                for book_id, is_available in patches:
+                    self.available[self.positions([book_id])] = is_available
+            self.availability_version = version
+
+    def filter_mask(self, available_only=False, category=None):
+        """Rows a search may return under the given filters, or ``None`` for all."""
+        mask = None
+        if available_only:
+            self.refresh_availability()
+            mask = self.available
+        if category is not None:
+            in_category = self.categories == int(category)
+            mask = in_category if mask is None else mask & in_category
+        return mask
+
+    def profile(self, book_ids):
+        """Normalised mean of the given books' vectors, or ``None``."""
+        rows = self.positions(book_ids)
+        if not len(rows):
+            return None
+        return normalize(self.matrix[rows].mean(axis=0))
+
+    def search(self, query, top_k=5, exclude_ids=(), mask=None):
+        """
+        Return ``(ids, scores)`` of the ``top_k`` rows closest to ``query``.
+
+        ``query`` must already be normalised. Only the winning ``top_k`` rows
+        are sorted (``argpartition``), not the whole catalogue. Rows where
+        ``mask`` is ``False`` are never returned.
+        """
+        if not len(self) or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.ann is not None:
+            keep = None if mask is None else (lambda ids: self.lookup(mask, ids))
+            return self.ann.search(query, top_k=top_k, exclude_ids=exclude_ids, keep=keep)
+
+        query = np.asarray(query, dtype=np.float32)
+        scores = self.scan.scores(query) if self.scan is not None else self.matrix @ query
+        excluded = self.positions(exclude_ids)
+        if len(excluded):
+            scores[excluded] = -np.inf
+
+        if mask is None:
+            available = len(scores) - len(excluded)
+        else:
+            scores[~mask] = -np.inf
+            available = int(mask.sum()) - int(mask[excluded].sum())
+        top_k = min(top_k, available)
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.scan is not None:
+            # Shortlist on the compressed scores, then re-rank exactly.
+            pool = min(top_k * getattr(settings, "EMBEDDING_RERANK_FACTOR", 10), available)
+            candidates = np.sort(np.argpartition(-scores, pool - 1)[:pool])
+            exact = np.asarray(self.matrix[candidates]) @ query
+            best = np.argpartition(-exact, top_k - 1)[:top_k]
+            best = best[np.argsort(-exact[best])]
+            return self.ids[candidates[best]], exact[best]
+
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return self.ids[best], scores[best]
+
+
+def shared_index_dir():
+    directory = getattr(settings, "EMBEDDING_INDEX_DIR", None)
+    return Path(directory) if directory else None
+
+
+def read_manifest(directory):
+    try:
+        with open(Path(directory) / MANIFEST_NAME) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory, manifest):
+    tmp = directory / f".{MANIFEST_NAME}.{os.getpid()}"
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, directory / MANIFEST_NAME)
+
+
+def publish_index(index, directory, keep=2, source_generation=None):
+    """
+    Save ``index`` as the next generation under ``directory`` and swap the
+    manifest to it atomically. Workers pick it up on their next lookup;
+    older generations beyond ``keep`` are removed (processes that still map
+    them keep reading the unlinked files until they reload).
+
+    ``source_generation`` is the ``current_generation()`` read before the
+    index was built; ``republish_index`` applies patches from there on.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    manifest = read_manifest(directory) or {}
+    generation = manifest.get("generation", 0) + 1
+    name = f"gen-{generation:08d}"
+    index.save(directory / name)
+
+    _write_manifest(directory, {
+        "generation": generation,
+        "path": name,
+        "count": len(index),
+        "dim": index.dim,
+        "source_generation": source_generation,
+    })
+
+    for old in sorted(directory.glob("gen-*"))[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    return generation
+
+
+def load_published_index(directory):
+    manifest = read_manifest(directory)
+    return EmbeddingIndex.load(Path(directory) / manifest["path"], generation=manifest["generation"])
+
+
+def republish_index(directory, keep=2, chunk_size=2000):
+    """
+    Bring the published index up to date with the books patched since it
+    was built and publish the result as the next generation: the changed
+    rows when the patch history still covers them, otherwise a full rebuild
+    keeping the published quantization and IVF layout. Returns the new
+    manifest generation, or ``None`` when there was nothing to do.
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+
+    generation = current_generation()
+    since = manifest.get("source_generation")
+    if since == generation:
+        return None
+    changed = _changed_since(since, generation) if since is not None else None
+    if changed == []:
+        # Only empty patches (e.g. a bump with nothing to re-read) since.
+        _write_manifest(directory, {**manifest, "source_generation": generation})
+        return None
+
+    published = load_published_index(directory)
+    if changed is not None:
+        index = published.patched(changed, published.generation)
+    else:
+        logger.warning("Patch history for %s has expired; rebuilding the published index.", directory)
+        index = EmbeddingIndex.build(chunk_size=chunk_size)
+        if published.scan is not None:
+            index = index.quantized(published.scan.kind)
+        if published.ann is not None and len(index):
+            index.ann = IVFIndex.build(
+                index.ids, index.matrix, n_lists=published.ann.n_lists, nprobe=published.ann.nprobe,
+            )
+    return publish_index(index, directory, keep=keep, source_generation=generation)
+
+
+_index = None
+_index_key = None
+_lock = threading.Lock()
+
+
+def _index_source():
+    """
+    Where the process index should come from, plus a key that changes
+    whenever that source does: the published file when EMBEDDING_INDEX_DIR
+    holds one, otherwise a build from the database.
+    """
+    directory = shared_index_dir()
+    if directory is not None:
+        try:
+            stat = (directory / MANIFEST_NAME).stat()
+        except FileNotFoundError:
+            pass
+        else:
+            return ("file", stat.st_ino, stat.st_mtime_ns), lambda: load_published_index(directory)
+
+    generation = current_generation()
+    index = _index
+    if index is not None and _index_key[0] == "db" and index.generation < generation:
+        changed = _changed_since(index.generation, generation)
+        if changed is not None:
+            return ("db", generation), lambda: index.patched(changed, generation)
+
+    return ("db", generation), lambda: EmbeddingIndex.build(
+        generation=generation,
+        chunk_size=getattr(settings, "EMBEDDING_INDEX_CHUNK_SIZE", 2000),
+    )
+
+
+def get_index():
+    """
+    Process-wide index, reloaded lazily once its source has changed.
+    """
+    global _index, _index_key
+
+    key, load = _index_source()
+    if _index is not None and _index_key == key:
+        return _index
+
+    with _lock:
+        if _index is None or _index_key != key:
+            _index = load()
+            _index_key = key
+        return _index
+
+
+def reset_index():
+    global _index, _index_key
+    with _lock:
+        _index = None
+        _index_key = None
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.ai_engine.collaborative import build_item_neighbours, refresh_item_neighbours
+
+
+class Command(BaseCommand):
+    help = "Compute item-item co-borrowing neighbours from BookIssue history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-n", type=int, default=None, help="Neighbours kept per book.")
+        parser.add_argument("--block", type=int, default=1024, help="Books per sparse product.")
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only recompute books borrowed since the last run.",
+        )
+
+    def handle(self, *args, top_n, block, incremental, **options):
+        build = refresh_item_neighbours if incremental else build_item_neighbours
+        written = build(top_n=top_n, block=block)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} neighbour rows."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ai_engine.index import (
+    EmbeddingIndex,
+    current_generation,
+    publish_index,
+    shared_index_dir,
+)
+from apps.ai_engine.quantization import KINDS
+from apps.ai_engine.recommender import IVFIndex
+
+
+class Command(BaseCommand):
+    help = "Export all book embeddings to a memory-mappable index shared by every worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", dest="directory", default=None, help="Defaults to settings.EMBEDDING_INDEX_DIR.")
+        parser.add_argument("--keep", type=int, default=2, help="Generations to keep on disk.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--ann",
+            action="store_true",
+            help="Also train an IVF approximate index and publish it with the vectors.",
+        )
+        parser.add_argument("--n-lists", type=int, default=None, help="IVF cells (default 4*sqrt(n)).")
+        parser.add_argument("--nprobe", type=int, default=8, help="Default cells probed per query.")
+        parser.add_argument(
+            "--quantize",
+            choices=KINDS,
+            default=None,
+            help="Also publish a compressed scan matrix (default settings.EMBEDDING_INDEX_QUANTIZATION).",
+        )
+
+    def handle(self, *args, directory, keep, chunk_size, ann, n_lists, nprobe, quantize, **options):
+        directory = directory or shared_index_dir()
+        if directory is None:
+            raise CommandError("Pass --dir or set EMBEDDING_INDEX_DIR.")
+
+        # Changes from here on are patched in by `republish_embedding_index`.
+        source_generation = current_generation()
+        index = EmbeddingIndex.build(chunk_size=chunk_size).quantized(quantize)
+        if ann and len(index):
+            index.ann = IVFIndex.build(index.ids, index.matrix, n_lists=n_lists, nprobe=nprobe)
+        generation = publish_index(index, directory, keep=max(keep, 1), source_generation=source_generation)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Published generation {generation}: {len(index)} books x {index.dim} dims to {directory}"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.library.services import generate_book_embeddings
+
+
+class Command(BaseCommand):
+    help = "Embed books whose title/author or embedding model changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Texts per model.encode call.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per DB round trip.")
+        parser.add_argument("--force", action="store_true", help="Re-encode every book.")
+
+    def handle(self, *args, batch_size, chunk_size, force, **options):
+        updated, encoded = generate_book_embeddings(
+            batch_size=batch_size,
+            chunk_size=chunk_size,
+            force=force,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} books ({encoded} texts encoded)."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.ai_engine.services import materialize_recommendations
+
+
+class Command(BaseCommand):
+    help = "Compute and store top-k recommendations for every active member in one batched pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--member-block", type=int, default=512, help="Members scored per matrix product.")
+        parser.add_argument("--book-block", type=int, default=32768, help="Books scored per matrix product.")
+
+    def handle(self, *args, top_k, member_block, book_block, **options):
+        written = materialize_recommendations(
+            top_k=top_k,
+            member_block=member_block,
+            book_block=book_block,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored recommendations for {written} members."))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+
+from apps.ai_engine.embeddings import (
+    decode_embedding,
+    default_dtype,
+    default_model_id,
+    encode_embedding,
+    is_encoded,
+    load_legacy_embedding,
+    read_header,
+)
+from apps.ai_engine.index import bump_generation
+from apps.library.models import Book
+
+
+class Command(BaseCommand):
+    help = "Rewrite Book.embedding blobs (legacy pickles included) in the binary embedding format."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dtype", choices=["float32", "float16"], default=None)
+        parser.add_argument("--model-id", default=None)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count rows that would change without writing them.",
+        )
+
+    def handle(self, *args, batch_size, dtype, model_id, dry_run, **options):
+        dtype = dtype or default_dtype()
+        model_id = model_id or default_model_id()
+
+        last_id = 0
+        scanned = converted = 0
+        unreadable = []
+
+        while True:
+            rows = list(
+                Book.objects
+                .filter(id__gt=last_id, embedding__isnull=False)
+                .order_by("id")
+                .values_list("id", "embedding")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            updates = []
+            for book_id, blob in rows:
+                try:
+                    if is_encoded(blob):
+                        header = read_header(blob)
+                        if header.dtype == dtype and header.model_id == model_id:
+                            continue
+                        vector = decode_embedding(blob)
+                    else:
+                        vector = load_legacy_embedding(blob)
+                except Exception as error:
+                    # One unreadable blob must not stop the rest of the table
+                    # converting; the book is re-embedded from its text instead.
+                    unreadable.append(book_id)
+                    self.stderr.write(f"Skipping book {book_id}: {type(error).__name__}: {error}")
+                    continue
+                updates.append(Book(id=book_id, embedding=encode_embedding(vector, model_id, dtype)))
+
+            converted += len(updates)
+            if updates and not dry_run:
+                Book.objects.bulk_update(updates, ["embedding"])
+
+        if unreadable and not dry_run:
+            Book.objects.filter(id__in=unreadable).update(embedding_hash="")
+        if converted and not dry_run:
+            bump_generation()
+
+        verb = "Would convert" if dry_run else "Converted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {converted} of {scanned} embeddings."))
+        if unreadable:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(unreadable)} unreadable embeddings; they are queued for re-embedding."
+            ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.ai_engine.services import rebuild_member_tastes
+
+
+class Command(BaseCommand):
+    help = "Rebuild every member's stored taste vector from their borrowing history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--member-block", type=int, default=2000)
+
+    def handle(self, *args, member_block, **options):
+        written = rebuild_member_tastes(member_block=member_block)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt taste vectors for {written} members."))
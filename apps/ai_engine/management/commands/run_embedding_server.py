@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ai_engine.encoder import get_model, warm_up
+from apps.ai_engine.service import make_server
+
+
+class Command(BaseCommand):
+    help = "Serve sentence embeddings to all workers from one process, batching concurrent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--address", default=None, help="Defaults to settings.EMBEDDING_SERVICE_ADDRESS.")
+        parser.add_argument("--max-batch", type=int, default=256, help="Most texts per model.encode call.")
+        parser.add_argument("--max-wait-ms", type=float, default=5.0, help="How long to wait for a batch to fill.")
+
+    def handle(self, *args, address, max_batch, max_wait_ms, **options):
+        address = address or settings.EMBEDDING_SERVICE_ADDRESS
+        if not address:
+            raise CommandError("Pass --address or set EMBEDDING_SERVICE_ADDRESS.")
+
+        warm_up()
+        model = get_model()
+
+        def encode(texts):
+            return model.encode(texts, batch_size=max_batch, convert_to_numpy=True)
+
+        server = make_server(address, encode, max_batch=max_batch, max_wait=max_wait_ms / 1000)
+        self.stdout.write(self.style.SUCCESS(f"Embedding server listening on {address}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
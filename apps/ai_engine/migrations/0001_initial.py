@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('library', '0004_book_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book_ids', models.JSONField(default=list)),
+                ('scores', models.JSONField(default=list)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation', to='library.member')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
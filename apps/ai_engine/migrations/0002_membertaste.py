@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0001_initial'),
+        ('library', '0004_book_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberTaste',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('vector_sum', models.BinaryField(blank=True, null=True)),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='taste', to='library.member')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
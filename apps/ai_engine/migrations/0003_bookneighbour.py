@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0002_membertaste'),
+        ('library', '0004_book_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='library.book')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'neighbour'), name='unique_book_neighbour')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:18
+
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+
+
+def backfill_book_ids(apps, schema_editor):
+    BookIssue = apps.get_model("library", "BookIssue")
+    MemberTaste = apps.get_model("ai_engine", "MemberTaste")
+    loans = (
+        BookIssue.objects
+        .order_by("member_id", "-id")
+        .values_list("member_id", "book_id")
+        .iterator(chunk_size=5000)
+    )
+    batch = {}
+
+    def flush():
+        MemberTaste.objects.bulk_create(
+            [MemberTaste(member_id=member_id) for member_id in batch],
+            ignore_conflicts=True,
+        )
+        tastes = list(MemberTaste.objects.filter(member_id__in=list(batch)))
+        for taste in tastes:
+            taste.book_ids = batch[taste.member_id]
+        MemberTaste.objects.bulk_update(tastes, ["book_ids"])
+        batch.clear()
+
+    for member_id, rows in groupby(loans, key=itemgetter(0)):
+        batch[member_id] = list(dict.fromkeys(book_id for _, book_id in rows))[:200]  # RECOMMENDATION_HISTORY_SIZE
+        if len(batch) >= 1000:
+            flush()
+    if batch:
+        flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0003_bookneighbour'),
+        ('library', '0009_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membertaste',
+            name='book_ids',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(backfill_book_ids, migrations.RunPython.noop),
+    ]
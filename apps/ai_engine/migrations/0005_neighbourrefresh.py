@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0004_membertaste_book_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeighbourRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('since', models.DateTimeField()),
+            ],
+        ),
+    ]
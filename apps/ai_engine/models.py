@@ -1,3 +1,90 @@
 from django.db import models
 
-# Create your models here.
+from apps.core.models import TimeStampedModel
+from apps.library.models import Book, Member
+
+
+class MemberRecommendation(TimeStampedModel):
+    """
+    Top-k books for a member, materialized by the nightly batch job so the
+    API serves a single row lookup. ``book_ids`` is ordered best first and
+    ``scores`` lines up with it, except for members without history: they
+    get the unscored catalogue fallback and an empty ``scores``.
+    """
+
+    member = models.OneToOneField(
+        Member,
+        on_delete=models.CASCADE,
+        related_name="recommendation"
+    )
+    book_ids = models.JSONField(default=list)
+    scores = models.JSONField(default=list)
+    generation = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Recommendations for {self.member}"
+
+
+class MemberTaste(TimeStampedModel):
+    """
+    Running sum of the (normalised) embeddings of every distinct book a
+    member has borrowed, and the ids of the last RECOMMENDATION_HISTORY_SIZE
+    of them, most recent loan first. ``issue_book`` adds to it in O(dim),
+    so a member's profile and the books to exclude from their
+    recommendations are one row read; ``rebuild_member_tastes`` repairs it
+    in bulk.
+    """
+
+    member = models.OneToOneField(
+        Member,
+        on_delete=models.CASCADE,
+        related_name="taste"
+    )
+    vector_sum = models.BinaryField(null=True, blank=True)
+    book_count = models.PositiveIntegerField(default=0)
+    book_ids = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Taste of {self.member}"
+
+
+class BookNeighbour(models.Model):
+    """
+    Item-item collaborative filtering: the top-N books most often borrowed
+    by the same members as ``book``, with their cosine similarity over the
+    member x book borrowing matrix.
+    """
+
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="neighbours"
+    )
+    neighbour = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["book", "neighbour"], name="unique_book_neighbour"),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbour_id} ({self.score:.3f})"
+
+
+class NeighbourRefresh(models.Model):
+    """
+    Progress of the ``BookNeighbour`` jobs (a single row): loans created
+    from ``since`` on have not been folded in yet. Kept in the database,
+    with the neighbours it describes, so a lost cache entry cannot turn the
+    hourly refresh into a full rebuild.
+    """
+
+    since = models.DateTimeField()
+
+    def __str__(self):
+        return f"Neighbours current up to {self.since:%Y-%m-%d %H:%M}"
@@ -0,0 +1,77 @@
+"""
+Compressed copies of the embedding matrix used to pick search candidates.
+
+``int8`` stores each row as ``round(x / scale)`` with a per-row
+``scale = max|x| / 127``, a quarter of the float32 size; ``float16`` is a
+plain cast at half the size. Either approximates the cosine only closely
+enough to shortlist candidates, which ``EmbeddingIndex.search`` re-ranks
+against the full-precision rows.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+KINDS = ("int8", "float16")
+
+
+class QuantizedMatrix:
+    """``codes`` (``int8`` or ``float16``) plus, for int8, one scale per row."""
+
+    def __init__(self, codes, scale=None):
+        self.codes = codes
+        self.scale = scale
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def kind(self):
+        return "int8" if self.codes.dtype == np.int8 else "float16"
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    @classmethod
+    def from_vectors(cls, vectors, kind="int8"):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if kind == "float16":
+            return cls(vectors.astype(np.float16))
+        if kind != "int8":
+            raise ValueError(f"Unknown quantization {kind!r}; expected one of {KINDS}.")
+
+        scale = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.empty(0, dtype=np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        codes = np.rint(vectors / scale[:, None]).clip(-127, 127).astype(np.int8)
+        return cls(codes, scale)
+
+    def scores(self, query, block=2048):
+        """
+        Approximate ``vectors @ query``. Rows are widened to float32
+        ``block`` at a time so the temporary stays small.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block):
+            stop = start + block
+            scores[start:stop] = self.codes[start:stop].astype(np.float32) @ query
+        if self.scale is not None:
+            scores *= self.scale
+        return scores
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "codes.npy", self.codes)
+        if self.scale is not None:
+            np.save(directory / "scale.npy", self.scale)
+        (directory / "scan.json").write_text(json.dumps({"kind": self.kind}))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        meta = json.loads((directory / "scan.json").read_text())
+        scale = np.load(directory / "scale.npy", mmap_mode=mode) if meta["kind"] == "int8" else None
+        return cls(np.load(directory / "codes.npy", mmap_mode=mode), scale)
@@ -0,0 +1,58 @@
+"""
+Per-member recommendation cache.
+
+One cache entry per member holds the recommended book ids for each
+``top_k`` asked for, stamped with the embedding index generation they were
+computed against; a newer generation makes the whole entry a miss.
+Circulation events drop the member's entry. Hit/miss totals are kept in
+the same cache so that, on a shared backend, they cover every worker.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.utils import bump_counter
+
+ENTRY_KEY = "ai_engine:recommendations:{}"
+HITS_KEY = "ai_engine:recommendations:hits"
+MISSES_KEY = "ai_engine:recommendations:misses"
+
+
+def get_recommendations(member_id, generation, top_k):
+    entry = cache.get(ENTRY_KEY.format(member_id))
+    if entry is not None and entry["generation"] == generation and top_k in entry["results"]:
+        bump_counter(HITS_KEY, initial=0)
+        return entry["results"][top_k]
+    bump_counter(MISSES_KEY, initial=0)
+    return None
+
+
+def set_recommendations(member_id, generation, top_k, book_ids):
+    key = ENTRY_KEY.format(member_id)
+    entry = cache.get(key)
+    if entry is None or entry["generation"] != generation:
+        entry = {"generation": generation, "results": {}}
+    entry["results"][top_k] = list(book_ids)
+    cache.set(key, entry, timeout=settings.RECOMMENDATION_CACHE_TIMEOUT)
+
+
+def invalidate_member(member_id):
+    cache.delete(ENTRY_KEY.format(member_id))
+
+
+def invalidate_members(member_ids):
+    cache.delete_many([ENTRY_KEY.format(member_id) for member_id in member_ids])
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
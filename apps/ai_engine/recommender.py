@@ -0,0 +1,182 @@
+"""
+Approximate nearest-neighbour search over book embeddings.
+
+``IVFIndex`` is an inverted-file index: a spherical k-means coarse quantizer
+splits the catalogue into ``n_lists`` cells and a query only scores the
+vectors in its ``nprobe`` closest cells. ``nprobe`` trades recall for
+latency; ``scripts/benchmark_ann.py`` measures both against brute force.
+"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from .embeddings import normalize
+
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+_EMPTY_SCORES = np.empty(0, dtype=np.float32)
+
+
+class IVFIndex:
+    """
+    Vectors are stored grouped by cell (``offsets[c]:offsets[c + 1]``) so a
+    probe reads contiguous slices. Inserts after training go to a small
+    delta buffer that is searched alongside the cells and folded in by
+    ``compact()``; re-inserting an id replaces its previous vector.
+    """
+
+    def __init__(self, centroids, nprobe=8):
+        self.centroids = normalize(centroids)
+        self.nprobe = nprobe
+
+        dim = self.centroids.shape[1]
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        self.ids = _EMPTY_IDS
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+
+        self._delta_ids = _EMPTY_IDS
+        self._delta_vectors = np.empty((0, dim), dtype=np.float32)
+        self._delta_lists = _EMPTY_IDS
+        self._delta_alive = np.empty(0, dtype=bool)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return int(self.alive.sum() + self._delta_alive.sum())
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, nprobe=8, sample_size=100_000, random_state=0):
+        """Fit the coarse quantizer on (a sample of) ``vectors``."""
+        from sklearn.cluster import MiniBatchKMeans
+
+        vectors = normalize(vectors)
+        if n_lists is None:
+            n_lists = int(4 * math.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        if len(vectors) > sample_size:
+            rng = np.random.default_rng(random_state)
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_lists,
+            batch_size=max(1024, 4 * n_lists),
+            n_init=3,
+            random_state=random_state,
+        ).fit(vectors)
+        return cls(kmeans.cluster_centers_, nprobe=nprobe)
+
+    @classmethod
+    def build(cls, ids, vectors, **train_options):
+        index = cls.train(vectors, **train_options)
+        index.add(ids, vectors)
+        index.compact()
+        return index
+
+    def assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def add(self, ids, vectors):
+        """Insert or replace ``ids``; they are searchable immediately."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if not len(ids):
+            return
+        vectors = normalize(vectors).reshape(len(ids), -1)
+
+        self.remove(ids)
+        self._delta_ids = np.concatenate([self._delta_ids, ids])
+        self._delta_vectors = np.concatenate([self._delta_vectors, vectors])
+        self._delta_lists = np.concatenate([self._delta_lists, self.assign(vectors)])
+        self._delta_alive = np.concatenate([self._delta_alive, np.ones(len(ids), dtype=bool)])
+
+    def remove(self, ids):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if not len(ids):
+            return
+        if len(self.ids):
+            self.alive = self.alive & ~np.isin(self.ids, ids)
+        if len(self._delta_ids):
+            self._delta_alive = self._delta_alive & ~np.isin(self._delta_ids, ids)
+
+    def compact(self):
+        """Fold the delta buffer into the cells and drop removed rows."""
+        lists = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        ids = np.concatenate([self.ids[self.alive], self._delta_ids[self._delta_alive]])
+        vectors = np.concatenate([self.vectors[self.alive], self._delta_vectors[self._delta_alive]])
+        lists = np.concatenate([lists[self.alive], self._delta_lists[self._delta_alive]])
+
+        order = np.argsort(lists, kind="stable")
+        self.ids = ids[order]
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.alive = np.ones(len(order), dtype=bool)
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.n_lists), out=self.offsets[1:])
+
+        dim = self.centroids.shape[1]
+        self._delta_ids = _EMPTY_IDS
+        self._delta_vectors = np.empty((0, dim), dtype=np.float32)
+        self._delta_lists = _EMPTY_IDS
+        self._delta_alive = np.empty(0, dtype=bool)
+
+    def search(self, query, top_k=5, nprobe=None, exclude_ids=(), keep=None):
+        """
+        Return ``(ids, scores)`` like ``EmbeddingIndex.search``. ``keep``
+        maps candidate ids to a boolean array of those allowed.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        rows = np.concatenate(
+            [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probed]
+        )
+        rows = rows[self.alive[rows]]
+        delta = np.flatnonzero(self._delta_alive & np.isin(self._delta_lists, probed))
+
+        ids = np.concatenate([self.ids[rows], self._delta_ids[delta]])
+        scores = np.concatenate([
+            self.vectors[rows] @ query,
+            self._delta_vectors[delta] @ query,
+        ])
+
+        if len(exclude_ids):
+            remaining = ~np.isin(ids, np.asarray(exclude_ids, dtype=np.int64))
+            ids, scores = ids[remaining], scores[remaining]
+        if keep is not None and len(ids):
+            allowed = keep(ids)
+            ids, scores = ids[allowed], scores[allowed]
+
+        top_k = min(top_k, len(ids))
+        if top_k <= 0:
+            return _EMPTY_IDS, _EMPTY_SCORES
+
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return ids[best], scores[best]
+
+    def save(self, directory):
+        self.compact()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "centroids.npy", self.centroids)
+        np.save(directory / "offsets.npy", self.offsets)
+        np.save(directory / "ids.npy", self.ids)
+        np.save(directory / "vectors.npy", self.vectors)
+        (directory / "ivf.json").write_text(json.dumps({"nprobe": self.nprobe}))
+
+    @classmethod
+    def load(cls, directory, nprobe=None, mmap=True):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        meta = json.loads((directory / "ivf.json").read_text())
+
+        index = cls(np.load(directory / "centroids.npy"), nprobe=nprobe or meta["nprobe"])
+        index.offsets = np.load(directory / "offsets.npy")
+        index.ids = np.load(directory / "ids.npy", mmap_mode=mode)
+        index.vectors = np.load(directory / "vectors.npy", mmap_mode=mode)
+        index.alive = np.ones(len(index.ids), dtype=bool)
+        return index
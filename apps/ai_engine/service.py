@@ -0,0 +1,250 @@
+"""
+Shared embedding service.
+
+One long-lived process (``manage.py run_embedding_server``) holds the model
+and serves every web/celery worker over a Unix socket or localhost TCP.
+Requests that arrive within ``max_wait`` of each other are coalesced into a
+single ``model.encode`` call of up to ``max_batch`` texts.
+
+Wire format, both directions: a 4 byte big-endian length, then a JSON
+header of that length. Requests are ``{"texts": [...]}``; responses are
+``{"shape": [n, dim]}`` followed by ``n * dim`` little-endian float32
+values, or ``{"error": "..."}``.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+def parse_address(address):
+    """``unix:/path/to.sock`` or ``host:port`` -> ``(family, address)``."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _send_header(sock, header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(data)) + data + payload)
+
+
+def _recv_header(sock):
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+class _Job:
+    __slots__ = ("texts", "done", "vectors", "error")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class Batcher(threading.Thread):
+    """Collects jobs from many connections and encodes them together."""
+
+    def __init__(self, encode, max_batch=256, max_wait=0.005):
+        super().__init__(daemon=True, name="embedding-batcher")
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+
+    def submit(self, texts):
+        job = _Job(texts)
+        self.jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.vectors
+
+    def _collect(self):
+        batch = [self.jobs.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += len(job.texts)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self._collect()
+            try:
+                texts = [text for job in batch for text in job.texts]
+                vectors = np.asarray(self.encode(texts), dtype="<f4")
+                start = 0
+                for job in batch:
+                    job.vectors = vectors[start:start + len(job.texts)]
+                    start += len(job.texts)
+            except Exception as exc:
+                logger.exception("Embedding batch of %d jobs failed", len(batch))
+                for job in batch:
+                    job.error = exc
+            for job in batch:
+                job.done.set()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv_header(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                vectors = self.server.batcher.submit(list(request["texts"]))
+            except Exception as exc:
+                _send_header(self.request, {"error": str(exc)})
+                continue
+            _send_header(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def make_server(address, encode, max_batch=256, max_wait=0.005):
+    family, bind_to = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_to):
+            os.unlink(bind_to)
+        server = _UnixServer(bind_to, _Handler)
+    else:
+        server = _TCPServer(bind_to, _Handler)
+
+    server.batcher = Batcher(encode, max_batch=max_batch, max_wait=max_wait)
+    server.batcher.start()
+    return server
+
+
+class EmbeddingClient:
+    """
+    Client for the embedding service. Keeps one connection per thread and
+    reconnects once if the server went away between calls.
+    """
+
+    def __init__(self, address, timeout=5.0):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, texts):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        _send_header(sock, {"texts": texts})
+        header = _recv_header(sock)
+        if "error" in header:
+            raise ServiceUnavailable(header["error"])
+        rows, dim = header["shape"]
+        payload = _recv_exact(sock, rows * dim * 4)
+        return np.frombuffer(payload, dtype="<f4").reshape(rows, dim)
+
+    def encode(self, texts):
+        texts = list(texts)
+        for attempt in range(2):
+            try:
+                return self._request(texts)
+            except ServiceUnavailable:
+                raise
+            except (OSError, ValueError) as exc:
+                self.close()
+                if attempt:
+                    raise ServiceUnavailable(str(exc)) from exc
+
+
+_client = None
+_client_lock = threading.Lock()
+_down_until = 0.0
+
+
+def get_client():
+    """The configured client, or ``None`` when EMBEDDING_SERVICE_ADDRESS is unset."""
+    global _client
+
+    address = getattr(settings, "EMBEDDING_SERVICE_ADDRESS", None)
+    if not address:
+        return None
+    if _client is None or _client.address != address:
+        with _client_lock:
+            if _client is None or _client.address != address:
+                _client = EmbeddingClient(address, timeout=getattr(settings, "EMBEDDING_SERVICE_TIMEOUT", 5.0))
+    return _client
+
+
+def remote_encode(texts):
+    """
+    Encode through the service. Returns ``None`` when it is not configured
+    or has failed recently, so callers can fall back to the local model.
+    """
+    global _down_until
+
+    client = get_client()
+    if client is None or time.monotonic() < _down_until:
+        return None
+    try:
+        return client.encode(texts)
+    except ServiceUnavailable as exc:
+        _down_until = time.monotonic() + getattr(settings, "EMBEDDING_SERVICE_RETRY_AFTER", 30)
+        logger.warning("Embedding service %s unavailable, encoding locally: %s", client.address, exc)
+        return None
@@ -0,0 +1,296 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from scipy import sparse
+
+from apps.library.models import Book, BookIssue, Member
+from .embeddings import decode_embedding, encode_embedding, is_encoded, normalize
+from .index import get_index
+from .models import MemberRecommendation, MemberTaste
+
+
+def _top_k_merge(best_ids, best_scores, ids, scores, top_k):
+    """Row-wise top-k of two ``(rows, k)`` candidate sets, best first."""
+    ids = np.concatenate([best_ids, ids], axis=1)
+    scores = np.concatenate([best_scores, scores], axis=1)
+    k = min(top_k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    part = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(ids, part, axis=1), np.take_along_axis(scores, part, axis=1)
+
+
+def _history_matrix(index, member_ids):
+    """Sparse ``members x index rows`` matrix of what each member has borrowed."""
+    positions = {member_id: row for row, member_id in enumerate(member_ids)}
+    pairs = np.array(
+        list(
+            BookIssue.objects
+            .filter(member_id__in=member_ids)
+            .values_list("member_id", "book_id")
+            .distinct()
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    rows = np.fromiter((positions[m] for m in pairs[:, 0]), dtype=np.int64, count=len(pairs))
+    cols = np.minimum(np.searchsorted(index.ids, pairs[:, 1]), max(len(index) - 1, 0))
+    found = index.ids[cols] == pairs[:, 1] if len(index) else np.zeros(len(pairs), dtype=bool)
+
+    return sparse.csr_matrix(
+        (np.ones(found.sum(), dtype=np.float32), (rows[found], cols[found])),
+        shape=(len(member_ids), len(index)),
+    )
+
+
+def score_members(index, member_ids, top_k=10, book_block=32768):
+    """
+    Top-k book ids and scores for a block of members.
+
+    Taste vectors (normalised mean of borrowed books) are stacked into one
+    matrix and scored against ``book_block`` books at a time, keeping a
+    running top-k per member, so memory is ``members x book_block`` no
+    matter how large the catalogue is. Borrowed books are masked out.
+    Members without history get empty rows.
+    """
+    history = _history_matrix(index, member_ids)
+    counts = np.asarray(history.sum(axis=1)).ravel()
+    taste = normalize(history @ np.asarray(index.matrix))
+
+    best_ids = np.full((len(member_ids), 0), -1, dtype=np.int64)
+    best_scores = np.full((len(member_ids), 0), -np.inf, dtype=np.float32)
+
+    for start in range(0, len(index), book_block):
+        stop = min(start + book_block, len(index))
+        scores = taste @ np.asarray(index.matrix[start:stop]).T
+
+        borrowed = history[:, start:stop].tocoo()
+        scores[borrowed.row, borrowed.col] = -np.inf
+
+        k = min(top_k, stop - start)
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_ids, best_scores = _top_k_merge(
+            best_ids,
+            best_scores,
+            index.ids[start:stop][part],
+            np.take_along_axis(scores, part, axis=1),
+            top_k,
+        )
+
+    results = []
+    for row, count in enumerate(counts):
+        keep = np.isfinite(best_scores[row]) if count else np.zeros(best_scores.shape[1], dtype=bool)
+        results.append((best_ids[row][keep].tolist(), best_scores[row][keep].round(6).tolist()))
+    return results
+
+
+def fallback_book_ids(top_k, exclude_ids=()):
+    """Newest books first: what members without a usable history are shown."""
+    books = Book.objects.exclude(id__in=list(exclude_ids)).order_by("-created_at", "id")
+    return list(books.values_list("id", flat=True)[:top_k])
+
+
+def materialize_recommendations(top_k=10, member_block=512, book_block=32768):
+    """
+    Recompute ``MemberRecommendation`` for every active member in blocks of
+    ``member_block`` and upsert each block with one ``bulk_create``.
+    Members without history get ``fallback_book_ids`` and no scores.
+    Returns the number of members written.
+    """
+    index = get_index()
+    fallback = fallback_book_ids(top_k)
+
+    member_ids = list(Member.objects.filter(is_active=True).order_by("id").values_list("id", flat=True))
+    written = 0
+
+    for start in range(0, len(member_ids), member_block):
+        block = member_ids[start:start + member_block]
+        results = score_members(index, block, top_k=top_k, book_block=book_block) if len(index) else [
+            ([], []) for _ in block
+        ]
+
+        rows = [
+            MemberRecommendation(
+                member_id=member_id,
+                book_ids=book_ids or fallback,
+                scores=scores if book_ids else [],
+                generation=index.generation,
+            )
+            for member_id, (book_ids, scores) in zip(block, results)
+        ]
+        with transaction.atomic():
+            MemberRecommendation.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["member"],
+                update_fields=["book_ids", "scores", "generation", "updated_at"],
+            )
+        written += len(rows)
+
+    return written
+
+
+def _encode_sum(vector):
+    return encode_embedding(vector, dtype="float32")
+
+
+def lock_tastes(member_ids):
+    """
+    Create any missing ``MemberTaste`` rows for ``member_ids`` and lock them
+    all, in member order. Circulation takes these locks before the book
+    rows' so concurrent checkouts cannot deadlock.
+    """
+    MemberTaste.objects.bulk_create(
+        [MemberTaste(member_id=member_id) for member_id in member_ids],
+        ignore_conflicts=True,
+    )
+    return list(
+        MemberTaste.objects.select_for_update().filter(member_id__in=list(member_ids)).order_by("member_id")
+    )
+
+
+def add_to_taste(member_id, book_id, embedding):
+    """
+    Record a newly issued book in the member's taste. Call inside the
+    issuing transaction, before the loan is inserted; the row is locked so
+    concurrent checkouts by the same member do not lose updates.
+    """
+    add_to_tastes([(member_id, book_id, embedding)])
+
+
+def add_to_tastes(loans):
+    """
+    ``add_to_taste`` for many ``(member_id, book_id, embedding)`` loans with
+    a fixed number of queries: one insert of missing rows, one locking read
+    and one ``bulk_update``. Each book moves to the front of ``book_ids``;
+    its embedding joins the sum only the first time the member borrows it.
+    """
+    limit = settings.RECOMMENDATION_HISTORY_SIZE
+    added = {}
+    for member_id, book_id, embedding in loans:
+        added.setdefault(member_id, []).append((book_id, embedding))
+    if not added:
+        return
+
+    tastes = lock_tastes(added)
+
+    # A full book_ids has dropped older books; for those members ask the
+    # loans (not yet inserted for this call) whether a book was borrowed
+    # before, so its vector isn't summed twice.
+    full = [taste.member_id for taste in tastes if len(taste.book_ids) >= limit]
+    earlier = set()
+    if full:
+        candidates = {book_id for member_id in full for book_id, _ in added[member_id]}
+        earlier = set(
+            BookIssue.objects
+            .filter(member_id__in=full, book_id__in=candidates)
+            .values_list("member_id", "book_id")
+        )
+
+    for taste in tastes:
+        borrowed = set(taste.book_ids)
+        vectors = []
+        for book_id, embedding in added[taste.member_id]:
+            new = book_id not in borrowed and (taste.member_id, book_id) not in earlier
+            if new and is_encoded(embedding):
+                vectors.append(normalize(decode_embedding(embedding)))
+            borrowed.add(book_id)
+        recent = [book_id for book_id, _ in reversed(added[taste.member_id])]
+        taste.book_ids = list(dict.fromkeys(recent + taste.book_ids))[:limit]
+        taste.updated_at = now()
+        if not vectors:
+            continue
+
+        vector = np.sum(vectors, axis=0)
+        if taste.vector_sum is not None:
+            current = decode_embedding(taste.vector_sum)
+            if current.shape == vector.shape:
+                vector = current + vector
+            else:
+                # Different embedding model; start over, the repair job refills it.
+                taste.book_count = 0
+
+        taste.vector_sum = _encode_sum(vector)
+        taste.book_count += len(vectors)
+
+    MemberTaste.objects.bulk_update(tastes, ["vector_sum", "book_count", "book_ids", "updated_at"])
+
+
+def member_history(member_id):
+    """
+    ``(profile, book_ids)``: the member's normalised taste vector (``None``
+    without one) and the last RECOMMENDATION_HISTORY_SIZE distinct books
+    they have borrowed, most recent first.
+    """
+    row = (
+        MemberTaste.objects
+        .filter(member_id=member_id)
+        .values_list("vector_sum", "book_count", "book_ids")
+        .first()
+    )
+    if row is None:
+        return None, []
+    vector_sum, book_count, book_ids = row
+    profile = normalize(decode_embedding(vector_sum)) if vector_sum is not None and book_count else None
+    return profile, book_ids
+
+
+def borrowed_book_ids(member_ids, limit=None):
+    """
+    ``{member_id: [book_id, ...]}``, distinct, most recent loan first and
+    at most ``limit`` (default RECOMMENDATION_HISTORY_SIZE) per member.
+    """
+    limit = limit or settings.RECOMMENDATION_HISTORY_SIZE
+    loans = (
+        BookIssue.objects
+        .filter(member_id__in=list(member_ids))
+        .order_by("member_id", "-id")
+        .values_list("member_id", "book_id")
+    )
+    borrowed = {}
+    for member_id, book_id in loans:
+        borrowed.setdefault(member_id, {})[book_id] = None
+    return {member_id: list(book_ids)[:limit] for member_id, book_ids in borrowed.items()}
+
+
+def rebuild_member_tastes(member_block=2000):
+    """
+    Recompute every member's taste from their borrowing history and the
+    current index in blocks, upserting each block with one ``bulk_create``.
+    Returns the number of members written.
+    """
+    index = get_index()
+    member_ids = list(Member.objects.order_by("id").values_list("id", flat=True))
+    written = 0
+
+    for start in range(0, len(member_ids), member_block):
+        block = member_ids[start:start + member_block]
+        borrowed = borrowed_book_ids(block)
+        if len(index):
+            history = _history_matrix(index, block)
+            counts = np.asarray(history.sum(axis=1)).ravel().astype(int)
+            sums = history @ np.asarray(index.matrix)
+        else:
+            counts = np.zeros(len(block), dtype=int)
+
+        rows = [
+            MemberTaste(
+                member_id=member_id,
+                vector_sum=_encode_sum(sums[row]) if counts[row] else None,
+                book_count=counts[row],
+                book_ids=borrowed.get(member_id, []),
+            )
+            for row, member_id in enumerate(block)
+        ]
+        with transaction.atomic():
+            MemberTaste.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["member"],
+                update_fields=["vector_sum", "book_count", "book_ids", "updated_at"],
+            )
+        written += len(rows)
+
+    return written
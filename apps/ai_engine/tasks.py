@@ -1,6 +1,70 @@
 from celery import shared_task
-from apps.library.services import send_overdue_reminder
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.library.models import Book
+from apps.library.notices import send_overdue_notices
+from apps.library.services import EMBEDDING_REFRESH_SCHEDULED_KEY, generate_book_embeddings
+from . import collaborative
+from .index import REPUBLISH_SCHEDULED_KEY, republish_index, shared_index_dir
+from .services import materialize_recommendations
+
+
+REPUBLISH_LOCK_KEY = "ai_engine:embedding_index:republishing"
+
 
 @shared_task
 def send_overdue_reminders():
-    send_overdue_reminder()
+    """Daily: email each member with overdue loans one reminder listing them."""
+    return send_overdue_notices()
+
+
+@shared_task
+def embed_pending_books():
+    """
+    Embed every book saved since the last run in one batched pass and patch
+    the workers' similarity indexes with just those rows. Queued shortly
+    after saves and swept every ten minutes for anything those missed.
+    """
+    cache.delete(EMBEDDING_REFRESH_SCHEDULED_KEY)  # see schedule_once
+    updated, encoded = generate_book_embeddings(
+        queryset=Book.objects.filter(embedding_hash=""),
+    )
+    return updated
+
+
+@shared_task
+def republish_embedding_index():
+    """
+    Fold books patched since the last export into the published index
+    (EMBEDDING_INDEX_DIR) and publish it as the next generation.
+    """
+    cache.delete(REPUBLISH_SCHEDULED_KEY)  # see schedule_once
+    directory = shared_index_dir()
+    if directory is None:
+        return None
+    # One publisher at a time: two would race for the same generation name.
+    if not cache.add(REPUBLISH_LOCK_KEY, True, timeout=60 * 30):
+        return None
+    try:
+        return republish_index(directory, chunk_size=settings.EMBEDDING_INDEX_CHUNK_SIZE)
+    finally:
+        cache.delete(REPUBLISH_LOCK_KEY)
+
+
+@shared_task
+def materialize_member_recommendations(top_k=10):
+    """Nightly: recompute MemberRecommendation for every active member."""
+    return materialize_recommendations(top_k=top_k)
+
+
+@shared_task
+def refresh_item_neighbours():
+    """Hourly: update co-borrowing neighbours of books borrowed since the last run."""
+    return collaborative.refresh_item_neighbours()
+
+
+@shared_task
+def build_item_neighbours():
+    """Nightly: full rebuild, trimming every list back to the top N."""
+    return collaborative.build_item_neighbours()
@@ -1,3 +1,653 @@
-from django.test import TestCase
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from apps.library.models import Book, BookIssue, Category, Member
+from apps.library.services import _blend, _recommended_book_ids, issue_book
+from apps.users.models import User
+from . import recommendation_cache, service
+from .collaborative import Interactions, build_item_neighbours, refresh_item_neighbours
+from .embeddings import decode_embedding, encode_embedding, load_legacy_embedding, normalize, read_header
+from .encoder import QueryCache
+from .index import (
+    EmbeddingIndex,
+    bump_generation,
+    get_index,
+    mark_availability,
+    patch_index,
+    republish_index,
+    reset_index,
+)
+from .models import BookNeighbour, MemberRecommendation, MemberTaste
+from .quantization import KINDS
+from .recommender import IVFIndex
+from .service import Batcher, EmbeddingClient, ServiceUnavailable, make_server, remote_encode
+from .services import materialize_recommendations, member_history
+
+
+class EmbeddingFormatTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        vector = np.random.default_rng(0).standard_normal(384).astype(np.float32)
+        for dtype, tolerance in (("float32", 0), ("float16", 1e-3)):
+            with self.subTest(dtype=dtype):
+                blob = encode_embedding(vector, model_id="test-model", dtype=dtype)
+                header = read_header(blob)
+                decoded = decode_embedding(blob)
+
+                self.assertEqual((header.dtype, header.dim, header.model_id), (np.dtype(dtype), 384, "test-model"))
+                self.assertEqual(header.offset % 8, 0)
+                np.testing.assert_allclose(decoded, vector, rtol=tolerance, atol=tolerance)
+
+    def test_legacy_pickles_of_every_protocol_load(self):
+        vector = np.arange(8, dtype=np.float32)
+        for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+            with self.subTest(protocol=protocol):
+                np.testing.assert_array_equal(load_legacy_embedding(pickle.dumps(vector, protocol=protocol)), vector)
+
+    def test_legacy_loader_refuses_other_objects(self):
+        with self.assertRaises(pickle.UnpicklingError):
+            load_legacy_embedding(pickle.dumps(StringIO("not an array")))
+
+
+class MigrateEmbeddingsTests(TestCase):
+
+    def test_converts_legacy_rows_and_skips_unreadable_ones(self):
+        category = Category.objects.create(name="Fiction")
+        vector = np.arange(4, dtype=np.float32)
+        blobs = {
+            "legacy": pickle.dumps(vector, protocol=5),
+            "encoded": encode_embedding(vector, dtype="float16"),
+            "garbage": b"\x80\x05not a pickle",
+        }
+        books = {
+            name: Book.objects.create(
+                title=name, author="A", isbn=name, category=category,
+                total_copies=1, available_copies=1, embedding=blob, embedding_hash="x" * 40,
+            )
+            for name, blob in blobs.items()
+        }
+
+        out, err = StringIO(), StringIO()
+        call_command("migrate_embeddings", dtype="float32", model_id="test-model", stdout=out, stderr=err)
+
+        self.assertIn("Converted 2 of 3", out.getvalue())
+        self.assertIn(f"Skipping book {books['garbage'].pk}", err.getvalue())
+        for name in ("legacy", "encoded"):
+            books[name].refresh_from_db()
+            np.testing.assert_array_equal(decode_embedding(bytes(books[name].embedding)), vector)
+        books["garbage"].refresh_from_db()
+        self.assertEqual(books["garbage"].embedding_hash, "")
+
+
+class PatchedIndexTests(TestCase):
+
+    def test_patch_inserts_new_books_into_the_ivf_index(self):
+        category = Category.objects.create(name="Fiction")
+        rng = np.random.default_rng(0)
+
+        def add_book(number):
+            return Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=1, available_copies=1,
+                embedding=encode_embedding(rng.standard_normal(16), dtype="float32"),
+            )
+
+        for number in range(40):
+            add_book(number)
+        index = EmbeddingIndex.build(generation=1)
+        index.ann = IVFIndex.build(index.ids, index.matrix, n_lists=4, nprobe=4)
+
+        new_book = add_book(40)
+        patched = index.patched([new_book.pk], generation=2)
+        query = decode_embedding(bytes(new_book.embedding))
+
+        self.assertIsNotNone(patched.ann)
+        self.assertEqual(patched.search(normalize(query), top_k=1)[0].tolist(), [new_book.pk])
+        self.assertNotIn(new_book.pk, index.ann.search(normalize(query), top_k=41)[0])
+
+
+class RepublishIndexTests(TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.category = Category.objects.create(name="Fiction")
+        self.rng = np.random.default_rng(0)
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+        # The republish task is driven by hand below; don't queue it.
+        patcher = mock.patch("apps.ai_engine.index.schedule_once")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_book(self, number):
+        return Book.objects.create(
+            title=f"Book {number}", author="A", isbn=str(number), category=self.category,
+            total_copies=1, available_copies=1,
+            embedding=encode_embedding(self.rng.standard_normal(16), dtype="float32"),
+        )
+
+    def test_patches_reach_workers_reading_the_published_index(self):
+        for number in range(5):
+            self.add_book(number)
+        with override_settings(EMBEDDING_INDEX_DIR=str(self.directory)):
+            call_command("export_embedding_index", stdout=StringIO())
+            before = get_index()
+
+            book = self.add_book(5)
+            patch_index([book.pk])
+            self.assertEqual(republish_index(self.directory), before.generation + 1)
+
+            after = get_index()
+            self.assertIn(book.pk, after.ids.tolist())
+            self.assertIsNone(republish_index(self.directory))
+
+    def test_expired_patch_history_rebuilds(self):
+        for number in range(5):
+            self.add_book(number)
+        with override_settings(EMBEDDING_INDEX_DIR=str(self.directory)):
+            call_command("export_embedding_index", stdout=StringIO())
+            book = self.add_book(5)
+            bump_generation()  # no patch recorded
+
+            with self.assertLogs("apps.ai_engine.index", "WARNING"):
+                republish_index(self.directory)
+            self.assertIn(book.pk, get_index().ids.tolist())
+
+
+class MemberHistoryTests(TestCase):
+
+    def test_recommendations_do_not_rescan_loans(self):
+        category = Category.objects.create(name="Fiction")
+        member = Member.objects.create(name="Ada", membership_id="M-1", email="ada@example.com")
+        rng = np.random.default_rng(0)
+        books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=5, available_copies=5,
+                embedding=encode_embedding(rng.standard_normal(16), dtype="float32"),
+            )
+            for number in range(6)
+        ]
+        for book in (books[0], books[1], books[0]):
+            issue_book(book, member)
+
+        profile, borrowed = member_history(member.pk)
+        self.assertEqual(borrowed, [books[0].pk, books[1].pk])
+        self.assertEqual(MemberTaste.objects.get(member=member).book_count, 2)
+
+        index = EmbeddingIndex.build(generation=1)
+        with CaptureQueriesContext(connection) as queries:
+            recommended = _recommended_book_ids(index, member, top_k=3)
+        self.assertFalse(any("library_bookissue" in query["sql"] for query in queries))
+        self.assertEqual(len(recommended), 3)
+        self.assertFalse({books[0].pk, books[1].pk} & set(recommended))
+
+    @override_settings(RECOMMENDATION_HISTORY_SIZE=2)
+    def test_book_ids_keep_only_recent_loans(self):
+        category = Category.objects.create(name="Fiction")
+        member = Member.objects.create(name="Ada", membership_id="M-1", email="ada@example.com")
+        books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=5, available_copies=5,
+                embedding=encode_embedding(np.eye(16, dtype=np.float32)[number], dtype="float32"),
+            )
+            for number in range(3)
+        ]
+        for book in (books[0], books[1], books[2], books[0]):
+            issue_book(book, member)
+
+        taste = MemberTaste.objects.get(member=member)
+        self.assertEqual(taste.book_ids, [books[0].pk, books[2].pk])
+        # Book 0 had dropped out of book_ids, but its vector is not summed twice.
+        self.assertEqual(taste.book_count, 3)
+        np.testing.assert_array_equal(decode_embedding(bytes(taste.vector_sum))[:3], [1, 1, 1])
+
+
+class RecommendationCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hits_misses_and_generation_invalidation(self):
+        get, put = recommendation_cache.get_recommendations, recommendation_cache.set_recommendations
+
+        self.assertIsNone(get(1, generation=1, top_k=5))
+        put(1, 1, 5, [30, 20, 10])
+        put(1, 1, 10, [30, 20, 10, 40])
+        self.assertEqual(get(1, 1, 5), [30, 20, 10])
+        self.assertEqual(get(1, 1, 10), [30, 20, 10, 40])
+        self.assertIsNone(get(2, 1, 5))
+
+        # A newer index generation makes every top_k of the entry stale.
+        self.assertIsNone(get(1, 2, 5))
+        put(1, 2, 5, [50])
+        self.assertIsNone(get(1, 2, 10))
+        self.assertEqual(get(1, 2, 5), [50])
+
+        recommendation_cache.invalidate_members([1])
+        self.assertIsNone(get(1, 2, 5))
+
+        self.assertEqual(recommendation_cache.stats(), {"hits": 3, "misses": 5, "hit_rate": 0.375})
+        recommendation_cache.reset_stats()
+        self.assertIsNone(recommendation_cache.stats()["hit_rate"])
+
+
+class MaterializeRecommendationsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def test_excludes_borrowed_books_and_falls_back_for_new_members(self):
+        category = Category.objects.create(name="Fiction")
+        rng = np.random.default_rng(0)
+        books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=5, available_copies=5,
+                embedding=encode_embedding(rng.standard_normal(16), dtype="float32"),
+            )
+            for number in range(6)
+        ]
+        for age, book in enumerate(books):
+            Book.objects.filter(pk=book.pk).update(created_at=now() - timedelta(days=age))
+        ada, bob, eve = [
+            Member.objects.create(name=name, membership_id=f"M-{name}", email=f"{name}@example.com")
+            for name in ("ada", "bob", "eve")
+        ]
+        Member.objects.filter(pk=eve.pk).update(is_active=False)
+        BookIssue.objects.bulk_create([
+            BookIssue(book=book, member=ada, due_date=now().date()) for book in (books[0], books[1], books[0])
+        ])
+
+        self.assertEqual(materialize_recommendations(top_k=3), 2)
+
+        ada_row = MemberRecommendation.objects.get(member=ada)
+        self.assertEqual(len(ada_row.book_ids), 3)
+        self.assertFalse({books[0].pk, books[1].pk} & set(ada_row.book_ids))
+        self.assertEqual(len(ada_row.scores), 3)
+        self.assertEqual(ada_row.scores, sorted(ada_row.scores, reverse=True))
+
+        bob_row = MemberRecommendation.objects.get(member=bob)
+        self.assertEqual((bob_row.book_ids, bob_row.scores), ([book.pk for book in books[:3]], []))
+        self.assertFalse(MemberRecommendation.objects.filter(member=eve).exists())
+
+
+class ItemNeighbourTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Fiction")
+        cls.books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=5, available_copies=5,
+            )
+            for number in range(4)
+        ]
+        cls.members = [
+            Member.objects.create(name=f"M{number}", membership_id=f"M-{number}", email=f"m{number}@example.com")
+            for number in range(4)
+        ]
+
+    def borrow(self, member, *books):
+        BookIssue.objects.bulk_create([BookIssue(book=book, member=member, due_date=now().date()) for book in books])
+
+    def neighbours(self, book):
+        return dict(BookNeighbour.objects.filter(book=book).values_list("neighbour_id", "score"))
+
+    def test_build_keeps_the_best_neighbours(self):
+        b0, b1, b2, b3 = self.books
+        m0, m1, m2, m3 = self.members
+        self.borrow(m0, b0, b1, b0)  # a repeat loan counts once
+        self.borrow(m1, b0, b1)
+        self.borrow(m2, b0, b2)
+        self.borrow(m3, b3)
+
+        written = build_item_neighbours(top_n=1)
+
+        self.assertEqual(written, BookNeighbour.objects.count())
+        self.assertEqual(list(self.neighbours(b0)), [b1.pk])
+        self.assertAlmostEqual(self.neighbours(b0)[b1.pk], 2 / np.sqrt(3 * 2), places=6)
+        self.assertAlmostEqual(self.neighbours(b2)[b0.pk], 1 / np.sqrt(3), places=6)
+        self.assertEqual(self.neighbours(b3), {})
+        self.assertFalse(BookNeighbour.objects.filter(book=F("neighbour")).exists())
+
+    def test_blend_mixes_content_and_co_borrowing(self):
+        index = EmbeddingIndex([1, 2, 3, 4], np.eye(4, dtype=np.float32))
+        profile = normalize(np.array([1, 0.5, 0, 0], dtype=np.float32))
+        book_ids, scores = index.search(profile, top_k=2)
+        # Book 4 is already borrowed: it is never returned, however related.
+        neighbours = {3: 2.0, 2: 1.0, 4: 4.0}
+
+        def blend(weight):
+            return _blend(index, profile, book_ids, scores, neighbours, [4], weight, top_k=3)
+
+        self.assertEqual(blend(0.5), [1, 2, 3])  # 0.447, 0.349, 0.25
+        self.assertEqual(blend(0.8), [3, 2, 1])  # 0.4, 0.289, 0.179
+
+    def test_refresh_reads_only_affected_members_and_matches_a_rebuild(self):
+        b0, b1, b2, b3 = self.books
+        m0, m1, m2, m3 = self.members
+        self.borrow(m0, b0, b1)
+        self.borrow(m1, b0, b1, b2)
+        self.borrow(m2, b3)
+        build_item_neighbours()
+
+        cache.clear()  # progress is kept in the database
+        self.borrow(m3, b0, b2)
+        with mock.patch.object(Interactions, "load", wraps=Interactions.load) as load:
+            refresh_item_neighbours()
+        (loans,), _ = load.call_args
+        self.assertEqual(set(loans.values_list("member_id", flat=True)), {m0.pk, m1.pk, m3.pk})
+        refreshed = {book.pk: self.neighbours(book) for book in (b0, b2)}
+
+        build_item_neighbours()
+        for book in (b0, b2):
+            rebuilt = self.neighbours(book)
+            self.assertEqual(refreshed[book.pk].keys(), rebuilt.keys())
+            for neighbour_id, score in rebuilt.items():
+                self.assertAlmostEqual(refreshed[book.pk][neighbour_id], score, places=6)
+        self.assertAlmostEqual(self.neighbours(b0)[b2.pk], 2 / np.sqrt(3 * 2), places=6)
+
+
+class QueryCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_query_is_evicted(self):
+        queries = QueryCache(maxsize=2)
+        for key in ("dune", "emma"):
+            queries.put(key, np.full(4, len(key), dtype=np.float32))
+        queries.get("dune")
+        queries.put("ulysses", np.zeros(4, dtype=np.float32))
+
+        self.assertIsNone(queries.get("emma"))
+        self.assertIsNotNone(queries.get("ulysses"))
+        self.assertFalse(queries.get("dune").flags.writeable)
+        self.assertEqual((queries.hits, queries.misses), (3, 1))
+
+
+@mock.patch("apps.ai_engine.encoder._query_cache", None)
+class SemanticSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fiction, cls.poetry = Category.objects.bulk_create([Category(name="Fiction"), Category(name="Poetry")])
+        axes = np.eye(8, dtype=np.float32)
+        cls.books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=1, available_copies=copies,
+                embedding=encode_embedding(axes[number], dtype="float32"),
+            )
+            for number, (category, copies) in enumerate([(cls.fiction, 1), (cls.fiction, 0), (cls.poetry, 1)])
+        ]
+        cls.user = User.objects.create_user(
+            email="member@example.com", name="Member", password="password123", role=User.Role.MEMBER,
+        )
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # The query lies closest to book 0, then book 1, then book 2.
+        self.encode = mock.patch(
+            "apps.ai_engine.encoder.encode_texts", return_value=np.array([[3, 2, 1, 0, 0, 0, 0, 0]], dtype=np.float32),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def search(self, **params):
+        response = self.client.get(reverse("book-semantic-search"), params)
+        if response.status_code != 200:
+            return response.status_code
+        return [item["id"] for item in response.data]
+
+    def test_results_are_ranked_and_filtered(self):
+        b0, b1, b2 = (book.pk for book in self.books)
+
+        self.assertEqual(self.search(q="Desert planets"), [b0, b1, b2])
+        self.assertEqual(self.search(q="desert   PLANETS", top_k=2), [b0, b1])
+        self.assertEqual(self.search(q="desert planets", category=self.poetry.pk), [b2])
+        self.assertEqual(self.search(q="desert planets", available_only="true"), [b0, b2])
+        # Every spelling of the query above was encoded once.
+        self.encode.assert_called_once_with(["desert planets"])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.search(q="  "), 400)
+        self.assertEqual(self.search(q="dune", top_k="ten"), 400)
+        self.assertEqual(self.search(q="dune", category="poetry"), 400)
+
+
+class ExactSearchTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.vectors = rng.standard_normal((300, 16)).astype(np.float32)
+        self.ids = np.arange(300) * 3 + 7  # sparse ids, so rows and ids differ
+        self.index = EmbeddingIndex(self.ids, normalize(self.vectors))
+        self.query = normalize(rng.standard_normal(16))
+
+    def brute_force(self, top_k, keep):
+        cosine = (self.vectors @ self.query) / np.linalg.norm(self.vectors, axis=1)
+        rows = sorted(np.flatnonzero(keep), key=lambda row: -cosine[row])[:top_k]
+        return self.ids[rows], cosine[rows]
+
+    def test_matches_brute_force_cosine(self):
+        every = np.ones(len(self.ids), dtype=bool)
+        in_mask = np.arange(len(self.ids)) % 4 == 0
+        excluded = self.ids[np.argsort(-(self.vectors @ self.query))[:5]].tolist() + [1, 2]  # plus unindexed ids
+        not_excluded = ~np.isin(self.ids, excluded)
+
+        cases = {
+            "plain": ({}, every),
+            "exclude": ({"exclude_ids": excluded}, not_excluded),
+            "mask": ({"mask": in_mask}, in_mask),
+            "mask and exclude": ({"mask": in_mask, "exclude_ids": excluded}, in_mask & not_excluded),
+        }
+        for name, (kwargs, keep) in cases.items():
+            for top_k in (1, 10, 500):
+                with self.subTest(name, top_k=top_k):
+                    book_ids, scores = self.index.search(self.query, top_k=top_k, **kwargs)
+                    expected_ids, expected_scores = self.brute_force(top_k, keep)
+                    np.testing.assert_array_equal(book_ids, expected_ids)
+                    np.testing.assert_allclose(scores, expected_scores, atol=1e-6)
+
+    def test_nothing_to_return(self):
+        nothing = np.zeros(len(self.ids), dtype=bool)
+        self.assertEqual(len(self.index.search(self.query, top_k=0)[0]), 0)
+        self.assertEqual(len(self.index.search(self.query, top_k=5, mask=nothing)[0]), 0)
+        self.assertEqual(len(self.index.search(self.query, top_k=5, exclude_ids=self.ids)[0]), 0)
+        empty = EmbeddingIndex([], np.empty((0, 0), dtype=np.float32))
+        self.assertEqual(len(empty.search(self.query, top_k=5)[0]), 0)
+
+
+@override_settings(EMBEDDING_RERANK_FACTOR=10)
+class QuantizedSearchTests(SimpleTestCase):
+
+    def test_recall_matches_the_float32_scan(self):
+        rng = np.random.default_rng(0)
+        topics = rng.standard_normal((50, 64))
+        vectors = normalize(topics[rng.integers(0, 50, 5000)] + 0.5 * rng.standard_normal((5000, 64)))
+        ids = np.arange(1, 5001)
+        queries = normalize(topics[rng.integers(0, 50, 40)] + 0.5 * rng.standard_normal((40, 64)))
+        exact = EmbeddingIndex(ids, vectors)
+
+        for kind in KINDS:
+            index = EmbeddingIndex(ids, vectors).quantized(kind)
+            found = 0
+            for query in queries:
+                expected_ids, _ = exact.search(query, top_k=10)
+                book_ids, scores = index.search(query, top_k=10)
+                found += len(set(book_ids.tolist()) & set(expected_ids.tolist()))
+                # Whatever is returned is scored at full precision.
+                np.testing.assert_allclose(scores, vectors[book_ids - 1] @ query, rtol=1e-5)
+            with self.subTest(kind=kind):
+                self.assertLess(index.scan.nbytes, vectors.nbytes)
+                self.assertGreaterEqual(found / (10 * len(queries)), 0.99)
+
+
+class FilterMaskTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fiction, cls.poetry = Category.objects.bulk_create([Category(name="Fiction"), Category(name="Poetry")])
+        rng = np.random.default_rng(0)
+        cls.books = [
+            Book.objects.create(
+                title=f"Book {number}", author="A", isbn=str(number), category=category,
+                total_copies=1, available_copies=copies,
+                embedding=encode_embedding(rng.standard_normal(16), dtype="float32"),
+            )
+            for number, (category, copies) in enumerate(
+                [(cls.fiction, 1), (cls.fiction, 0), (cls.poetry, 1), (cls.fiction, 1)]
+            )
+        ]
+        cls.member = Member.objects.create(name="Ada", membership_id="M-1", email="ada@example.com")
+
+    def setUp(self):
+        cache.clear()
+
+    def masked(self, index, **filters):
+        return index.ids[index.filter_mask(**filters)].tolist()
+
+    def test_category_and_availability_masks(self):
+        b0, b1, b2, b3 = (book.pk for book in self.books)
+        index = EmbeddingIndex.build()
+
+        self.assertIsNone(index.filter_mask())
+        self.assertEqual(self.masked(index, category=self.fiction.pk), [b0, b1, b3])
+        self.assertEqual(self.masked(index, available_only=True), [b0, b2, b3])
+        self.assertEqual(self.masked(index, available_only=True, category=self.fiction.pk), [b0, b3])
+
+        # Circulation patches the mask in place...
+        mark_availability(b0, False)
+        mark_availability(b1, True)
+        self.assertEqual(self.masked(index, available_only=True), [b1, b2, b3])
+        # ...and once the patches are gone it is re-read from the database.
+        cache.clear()
+        mark_availability(b3, False)
+        self.assertEqual(self.masked(index, available_only=True), [b0, b2, b3])
+
+        query = normalize(np.ones(16, dtype=np.float32))
+        book_ids, _ = index.search(query, top_k=4, mask=index.filter_mask(category=self.poetry.pk))
+        self.assertEqual(book_ids.tolist(), [b2])
+
+    def test_masked_fallback_excludes_borrowed_books(self):
+        b0, b1, b2, b3 = (book.pk for book in self.books)
+        index = EmbeddingIndex.build()
+        mask = index.filter_mask(category=self.fiction.pk)
+
+        # No usable profile (e.g. after a model change) and no neighbours.
+        with (
+            mock.patch("apps.library.services.member_history", return_value=(None, [b0])),
+            mock.patch.object(index, "profile", return_value=None),
+        ):
+            self.assertEqual(_recommended_book_ids(index, self.member, top_k=5, mask=mask), [b1, b3])
+
+
+def fake_model(texts):
+    """Stands in for the model: one row per text, recording each batch it is given."""
+    fake_model.batches.append(list(texts))
+    if "boom" in texts:
+        raise ValueError("model failed")
+    return [[len(text), 1.0] for text in texts]
+
+
+class EmbeddingServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        fake_model.batches = []
+        self.server = make_server("127.0.0.1:0", fake_model, max_wait=0.001)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.address = "127.0.0.1:%d" % self.server.server_address[1]
+
+        service._client, service._down_until = None, 0.0
+        self.addCleanup(setattr, service, "_client", None)
+        self.addCleanup(setattr, service, "_down_until", 0.0)
+
+    def test_round_trip(self):
+        client = EmbeddingClient(self.address)
+        self.addCleanup(client.close)
+        vectors = client.encode(["a", "abc"])
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_array_equal(vectors, [[1, 1], [3, 1]])
+        # The connection is reused, and a model error is reported without dropping it.
+        with self.assertLogs("apps.ai_engine.service", "ERROR"), self.assertRaisesMessage(ServiceUnavailable, "model failed"):
+            client.encode(["boom"])
+        np.testing.assert_array_equal(client.encode(["ab"]), [[2, 1]])
+
+    def test_concurrent_requests_share_a_batch(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_model(texts):
+            if not started.is_set():
+                started.set()
+                release.wait(5)  # hold the first batch while the others queue up
+            return fake_model(texts)
+
+        batcher = Batcher(slow_model, max_batch=16)
+        batcher.start()
+        results = {}
+
+        def submit(texts):
+            results[texts[0]] = batcher.submit(texts)
+
+        threads = [threading.Thread(target=submit, args=(["x" * n] * n,)) for n in range(1, 6)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        while batcher.jobs.qsize() < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # The four jobs that waited went to the model as one call, and each
+        # caller got back exactly its own rows.
+        self.assertEqual([len(batch) for batch in fake_model.batches], [1, 2 + 3 + 4 + 5])
+        for n in range(1, 6):
+            np.testing.assert_array_equal(results["x" * n], [[n, 1]] * n)
+
+    def test_remote_encode_falls_back_while_the_server_is_down(self):
+        with override_settings(EMBEDDING_SERVICE_ADDRESS=self.address, EMBEDDING_SERVICE_RETRY_AFTER=30):
+            np.testing.assert_array_equal(remote_encode(["abcd"]), [[4, 1]])
+
+            self.server.shutdown()
+            self.server.server_close()
+            service.get_client().close()  # drop the pooled connection too
+            with self.assertLogs("apps.ai_engine.service", "WARNING"):
+                self.assertIsNone(remote_encode(["abcd"]))
+
+            # Until the retry window passes, the server isn't even tried.
+            with mock.patch.object(EmbeddingClient, "_connect") as connect:
+                self.assertIsNone(remote_encode(["abcd"]))
+            connect.assert_not_called()
+
+        with override_settings(EMBEDDING_SERVICE_ADDRESS=None):
+            self.assertIsNone(remote_encode(["abcd"]))
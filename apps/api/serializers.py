@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from apps.users.models import User, MemberProfile
 
-from apps.library.models import Book, Category, Member, BookIssue
+from apps.library.models import Book, Category, Member, BookIssue, FineBalance
 
 class SignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -31,7 +31,13 @@ class CategorySerializer(serializers.ModelSerializer):
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = "__all__"
+        exclude = ("search_vector",)
+
+
+class BookSearchResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        exclude = ("embedding", "embedding_hash", "search_vector")
 
 
 class MemberSerializer(serializers.ModelSerializer):
@@ -40,6 +46,14 @@ class MemberSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class FineBalanceSerializer(serializers.ModelSerializer):
+    member_name = serializers.CharField(source="member.name", read_only=True)
+
+    class Meta:
+        model = FineBalance
+        fields = ("member", "member_name", "balance", "updated_at")
+
+
 class BookIssueSerializer(serializers.ModelSerializer):
     class Meta:
         model = BookIssue
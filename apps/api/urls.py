@@ -10,8 +10,17 @@ from .views import (
     RejectManagementRequestAPIView,
     IssueBookAPIView,
     ReturnBookAPIView,
+    BulkIssueBookAPIView,
+    BulkReturnBookAPIView,
     OverdueReportAPIView,
+    ActiveLoanReportAPIView,
+    CirculationHistoryReportAPIView,
     BookRecommendationAPIView,
+    RecommendationCacheStatsAPIView,
+    SemanticBookSearchAPIView,
+    BookAutocompleteAPIView,
+    FineBalanceReportAPIView,
+    MemberFineBalanceAPIView,
 )
 from .viewsets import BookViewSet, CategoryViewSet, MemberViewSet
 
@@ -43,8 +52,17 @@ urlpatterns = [
     # Book issue/return & reports
     path("books/issue/", IssueBookAPIView.as_view(), name="issue-book"),
     path("books/return/<int:issue_id>/", ReturnBookAPIView.as_view(), name="return-book"),
+    path("books/issue/bulk/", BulkIssueBookAPIView.as_view(), name="issue-book-bulk"),
+    path("books/return/bulk/", BulkReturnBookAPIView.as_view(), name="return-book-bulk"),
     path("reports/overdue/", OverdueReportAPIView.as_view(), name="overdue-report"),
+    path("reports/active-loans/", ActiveLoanReportAPIView.as_view(), name="active-loan-report"),
+    path("reports/circulation/", CirculationHistoryReportAPIView.as_view(), name="circulation-report"),
+    path("reports/fines/", FineBalanceReportAPIView.as_view(), name="fine-balance-report"),
+    path("members/<int:member_id>/fines/", MemberFineBalanceAPIView.as_view(), name="member-fine-balance"),
     path("books/recommend/<int:member_id>/", BookRecommendationAPIView.as_view(), name="book-recommendation"),
+    path("books/autocomplete/", BookAutocompleteAPIView.as_view(), name="book-autocomplete"),
+    path("books/semantic-search/", SemanticBookSearchAPIView.as_view(), name="book-semantic-search"),
+    path("reports/recommendation-cache/", RecommendationCacheStatsAPIView.as_view(), name="recommendation-cache-stats"),
 
     # ViewSets
     path("", include(router.urls)),
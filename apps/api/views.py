@@ -5,6 +5,8 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from django.db import transaction
+
 
 
 
@@ -22,15 +24,16 @@ class SignupAPI(APIView):
     def post(self, request):
         serializer = SignupSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-        # Create Member instance
-        member = Member.objects.create(
-            name=user.name,
-            email=user.email,
-            membership_id=f"MEM{user.id:04d}"  # Generate membership ID
-        )
-        # Send welcome email
-        send_welcome_email(member)
+        with transaction.atomic():
+            user = serializer.save()
+            # Create Member instance
+            member = Member.objects.create(
+                name=user.name,
+                email=user.email,
+                membership_id=f"MEM{user.id:04d}"  # Generate membership ID
+            )
+            # Queue welcome email (committed with the user, sent in the background)
+            send_welcome_email(member)
         return Response({"message": "Signup successful"}, status=status.HTTP_201_CREATED)
 
 
@@ -105,9 +108,11 @@ class RejectManagementRequestAPIView(APIView):
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 from apps.library.models import Book, Member, BookIssue
-from apps.library.services import issue_book, return_book
+from django.conf import settings
+from apps.library.services import issue_book, issue_books, return_book, return_books
 from .serializers import BookIssueSerializer
 
 class IssueBookAPIView(APIView):
@@ -126,28 +131,145 @@ class ReturnBookAPIView(APIView):
         return Response(BookIssueSerializer(issue).data)
 
 
-class OverdueReportAPIView(APIView):
-    def get(self, request):
-        overdue = BookIssue.objects.filter(
-            return_date__isnull=True,
-            due_date__lt=now().date()
-        )
-        return Response(BookIssueSerializer(overdue, many=True).data)
+def _bulk_results(keys, results):
+    return [
+        {**key, "issue": BookIssueSerializer(issue).data} if error is None else {**key, "error": error}
+        for key, (issue, error) in zip(keys, results)
+    ]
+
 
+class BulkIssueBookAPIView(APIView):
+    """POST ``{"items": [{"book_id": 1, "member_id": 2}, ...]}``."""
 
-from apps.library.services import send_overdue_email
+    def post(self, request):
+        items = request.data.get("items")
+        if not isinstance(items, list) or not items:
+            return Response({"error": "items must be a non-empty list"}, status=400)
+        if len(items) > settings.CIRCULATION_BULK_MAX_ITEMS:
+            return Response({"error": f"At most {settings.CIRCULATION_BULK_MAX_ITEMS} items"}, status=400)
+        try:
+            pairs = [(int(item["book_id"]), int(item["member_id"])) for item in items]
+        except (TypeError, KeyError, ValueError):
+            return Response({"error": "Each item needs integer book_id and member_id"}, status=400)
+
+        results = issue_books(pairs)
+        keys = [{"book_id": book_id, "member_id": member_id} for book_id, member_id in pairs]
+        return Response({"results": _bulk_results(keys, results)})
+
+
+class BulkReturnBookAPIView(APIView):
+    """POST ``{"issue_ids": [1, 2, ...]}``."""
+
+    def post(self, request):
+        issue_ids = request.data.get("issue_ids")
+        if not isinstance(issue_ids, list) or not issue_ids:
+            return Response({"error": "issue_ids must be a non-empty list"}, status=400)
+        if len(issue_ids) > settings.CIRCULATION_BULK_MAX_ITEMS:
+            return Response({"error": f"At most {settings.CIRCULATION_BULK_MAX_ITEMS} items"}, status=400)
+        try:
+            issue_ids = [int(issue_id) for issue_id in issue_ids]
+        except (TypeError, ValueError):
+            return Response({"error": "issue_ids must be integers"}, status=400)
+
+        results = return_books(issue_ids)
+        keys = [{"issue_id": issue_id} for issue_id in issue_ids]
+        return Response({"results": _bulk_results(keys, results)})
+
+
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from apps.core.pagination import KeysetPagination
+from apps.core.renderers import CSVRenderer, NDJSONRenderer, iter_csv, iter_ndjson
+
+
+class LoanReportAPIView(APIView):
+    """
+    Loan report as JSON, or streamed as ``?format=csv`` / ``?format=ndjson``.
+
+    Streamed exports read flat ``values()`` rows through a chunked
+    iterator (a server-side cursor on PostgreSQL) and write them as they
+    arrive, so memory stays flat however many loans match.
+    """
+
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, NDJSONRenderer]
+    export_fields = (
+        "id",
+        "book_id",
+        "book__title",
+        "book__isbn",
+        "member_id",
+        "member__name",
+        "member__membership_id",
+        "issue_date",
+        "due_date",
+        "return_date",
+        "fine_amount",
+    )
+    export_name = "loans"
+    paginate_json = True
+    pagination_class = KeysetPagination
+    queryset = None
+
+    def get_queryset(self):
+        assert self.queryset is not None, f"{type(self).__name__} must set queryset or override get_queryset()"
+        return self.queryset.all()
 
-class OverdueReportAPIView(APIView):
     def get(self, request):
-        overdue = BookIssue.objects.filter(
+        queryset = self.get_queryset()
+        export_format = request.accepted_renderer.format
+        if export_format in ("csv", "ndjson"):
+            return self.stream(queryset, export_format)
+
+        if not self.paginate_json:
+            return Response(BookIssueSerializer(queryset, many=True).data)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(BookIssueSerializer(page, many=True).data)
+
+    def stream(self, queryset, export_format):
+        rows = queryset.values(*self.export_fields).iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+        if export_format == "csv":
+            content, content_type = iter_csv(rows, self.export_fields), "text/csv"
+        else:
+            content, content_type = iter_ndjson(rows), "application/x-ndjson"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f"{self.export_name}-{now():%Y%m%d}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class OverdueReportAPIView(LoanReportAPIView):
+    export_name = "overdue"
+    paginate_json = False
+
+    def get_queryset(self):
+        return BookIssue.objects.filter(
             return_date__isnull=True,
             due_date__lt=now().date()
-        )
+        ).order_by("due_date", "id")
+
+
+class ActiveLoanReportAPIView(LoanReportAPIView):
+    export_name = "active-loans"
+    queryset = BookIssue.objects.filter(return_date__isnull=True).order_by("due_date", "id")
 
-        for issue in overdue:
-            send_overdue_email(issue)
 
-        return Response(BookIssueSerializer(overdue, many=True).data)
+class CirculationHistoryReportAPIView(LoanReportAPIView):
+    """All loans, optionally issued within ``?from=`` .. ``?to=`` (YYYY-MM-DD, inclusive)."""
+
+    export_name = "circulation"
+    queryset = BookIssue.objects.order_by("issue_date", "id")
+
+    def get_queryset(self):
+        loans = super().get_queryset()
+        start = parse_date(self.request.query_params.get("from", ""))
+        end = parse_date(self.request.query_params.get("to", ""))
+        if start:
+            loans = loans.filter(issue_date__gte=start)
+        if end:
+            loans = loans.filter(issue_date__lte=end)
+        return loans
 
 
 # library_lms/apps/api/views.py
@@ -161,6 +283,101 @@ from .serializers import BookSerializer
 class BookRecommendationAPIView(APIView):
     def get(self, request, member_id):
         member = Member.objects.get(id=member_id)
-        books = recommend_books_for_member(member)
+        category = request.query_params.get("category")
+        if category and not category.isdigit():
+            return Response({"error": "category must be an integer"}, status=400)
+        books = recommend_books_for_member(
+            member,
+            available_only=request.query_params.get("available_only") in ("1", "true", "True"),
+            category=int(category) if category else None,
+        )
         serializer = BookSerializer(books, many=True)
         return Response(serializer.data)
+
+
+from apps.ai_engine import recommendation_cache
+
+
+class RecommendationCacheStatsAPIView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response(recommendation_cache.stats())
+
+
+from apps.library.services import semantic_search
+from .serializers import BookSearchResultSerializer
+
+
+class SemanticBookSearchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "q is required"}, status=400)
+
+        try:
+            top_k = min(max(int(request.query_params.get("top_k", 10)), 1), 50)
+            category = request.query_params.get("category")
+            category = int(category) if category else None
+        except ValueError:
+            return Response({"error": "top_k and category must be integers"}, status=400)
+        available_only = request.query_params.get("available_only") in ("1", "true", "True")
+
+        results = semantic_search(query, top_k=top_k, category=category, available_only=available_only)
+        data = []
+        for book, score in results:
+            item = BookSearchResultSerializer(book).data
+            item["score"] = round(score, 4)
+            data.append(item)
+        return Response(data)
+
+
+from django.utils.cache import patch_cache_control
+from apps.library.autocomplete import get_prefix_index
+
+
+class BookAutocompleteAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 20)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+
+        prefix = request.query_params.get("prefix", "")
+        response = Response(get_prefix_index().search(prefix, limit=limit))
+        patch_cache_control(response, private=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+        return response
+
+
+from decimal import Decimal, InvalidOperation
+from apps.library.models import FineBalance
+from .serializers import FineBalanceSerializer
+
+
+class FineBalanceReportAPIView(APIView):
+    """Members owing at least ``?min_balance=`` (default anything), largest first."""
+
+    def get(self, request):
+        try:
+            min_balance = Decimal(request.query_params.get("min_balance", "0.01"))
+        except InvalidOperation:
+            return Response({"error": "min_balance must be a number"}, status=400)
+
+        balances = (
+            FineBalance.objects
+            .filter(balance__gte=min_balance)
+            .select_related("member")
+            .order_by("-balance", "member_id")
+        )
+        return Response(FineBalanceSerializer(balances, many=True).data)
+
+
+class MemberFineBalanceAPIView(APIView):
+    def get(self, request, member_id):
+        balance = FineBalance.objects.filter(member_id=member_id).values_list("balance", flat=True).first()
+        balance = (balance or Decimal(0)).quantize(Decimal("0.01"))
+        return Response({"member": member_id, "balance": str(balance)})
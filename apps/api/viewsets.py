@@ -1,4 +1,7 @@
+from rest_framework.filters import OrderingFilter
 from rest_framework.viewsets import ModelViewSet
+from apps.core.filters import FullTextSearchFilter
+from apps.core.pagination import KeysetPagination
 from apps.library.models import Book, Category, Member
 from .serializers import BookSerializer, CategorySerializer, MemberSerializer
 from rest_framework.permissions import IsAuthenticated
@@ -13,10 +16,15 @@ class BookViewSet(ModelViewSet):
     queryset = Book.objects.all().order_by('-created_at', 'id')
     serializer_class = BookSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
     search_fields = ["title", "author", "isbn"]
+    search_vector_field = "search_vector"
+    search_exact_fields = ["isbn"]
 
 
 class MemberViewSet(ModelViewSet):
     queryset = Member.objects.all().order_by('-created_at', 'id')
     serializer_class = MemberSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
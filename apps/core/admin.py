@@ -1,3 +1,11 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import EmailOutbox
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    readonly_fields = ("attempts", "sent_at", "last_error")
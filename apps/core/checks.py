@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose entries live in one process (or nowhere).
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The embedding index generation and patches, autocomplete generation,
+    task de-duplication keys and recommendation stats are coordinated
+    through the default cache, so every web and celery process must see
+    the same one.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint=(
+                "Index updates, cache invalidations and task de-duplication "
+                "will not reach other web or celery workers. Point REDIS_URL "
+                "at a Redis instance shared by all of them."
+            ),
+            id="core.W001",
+        )
+    ]
@@ -0,0 +1,41 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ``?search=`` against the view's ``search_vector_field`` (a GIN-indexed
+    tsvector), best ``ts_rank`` first, OR an exact match on any of
+    ``search_exact_fields``.
+
+    Off PostgreSQL, or for views without a vector field, this is plain
+    ``SearchFilter`` over ``search_fields``.
+    """
+
+    search_config = "english"
+
+    def filter_queryset(self, request, queryset, view):
+        vector_field = getattr(view, "search_vector_field", None)
+        if vector_field is None or connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+
+        terms = " ".join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+
+        query = SearchQuery(terms, search_type="websearch", config=self.search_config)
+        condition = Q(**{vector_field: query})
+        for field in getattr(view, "search_exact_fields", ()):
+            condition |= Q(**{field: terms})
+
+        return (
+            queryset
+            .filter(condition)
+            # ts_rank is a float4; as a double it survives the keyset
+            # cursor's JSON round trip exactly.
+            .annotate(search_rank=Cast(SearchRank(F(vector_field), query), FloatField()))
+            .order_by("-search_rank", "pk")
+        )
@@ -14,6 +14,7 @@ class TimeStampedModel(models.Model):
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -30,3 +31,39 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+
+
+class EmailOutbox(TimeStampedModel):
+    """
+    An email waiting to be sent. Rows are written in the same transaction as
+    the change that triggers them and delivered by ``apps.core.outbox``, so a
+    rolled-back request sends nothing and no request waits on SMTP.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, default="")
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # The dispatcher only ever scans due, unsent rows.
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="PENDING"),
+                name="emailoutbox_pending_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
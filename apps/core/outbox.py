@@ -0,0 +1,132 @@
+"""
+Transactional email outbox.
+
+``enqueue_email`` writes an ``EmailOutbox`` row inside the caller's
+transaction and, once that commits, queues a ``dispatch_email_outbox``
+run. ``dispatch_outbox`` claims due rows with ``SELECT ... FOR UPDATE
+SKIP LOCKED`` so several workers can drain the table without sending the
+same email twice, delivers each batch over one SMTP connection and
+reschedules failures with exponential backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import EmailOutbox
+from .utils import schedule_once
+
+DISPATCH_SCHEDULED_KEY = "core:email_outbox:scheduled"
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """Record an email to be sent once the current transaction commits."""
+    email = EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        to=list(to),
+        from_email=from_email or "",
+    )
+    transaction.on_commit(schedule_dispatch)
+    return email
+
+
+def schedule_dispatch():
+    """
+    Queue one ``dispatch_email_outbox`` run for everything enqueued in the
+    next EMAIL_OUTBOX_DISPATCH_DELAY seconds. The beat schedule sweeps the
+    outbox regardless, so a missed kick only delays delivery.
+    """
+    from .tasks import dispatch_email_outbox
+
+    schedule_once(DISPATCH_SCHEDULED_KEY, dispatch_email_outbox, settings.EMAIL_OUTBOX_DISPATCH_DELAY)
+
+
+def retry_delay(attempts):
+    """Backoff before attempt ``attempts + 1``: doubling, capped."""
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def _message(email, connection):
+    return EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.to,
+        connection=connection,
+    )
+
+
+def _record_failure(email, error, at):
+    email.attempts += 1
+    email.last_error = f"{type(error).__name__}: {error}"
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = EmailOutbox.Status.FAILED
+    else:
+        email.next_attempt_at = at + retry_delay(email.attempts)
+
+
+@transaction.atomic
+def _dispatch_batch(connection, batch_size):
+    """Claim, send and record one batch. Returns (claimed, sent)."""
+    claimed = list(
+        EmailOutbox.objects
+        .select_for_update(skip_locked=True)
+        .filter(status=EmailOutbox.Status.PENDING, next_attempt_at__lte=now())
+        .order_by("next_attempt_at", "id")[:batch_size]
+    )
+    if not claimed:
+        return 0, 0
+
+    sent = 0
+    try:
+        connection.open()
+    except Exception as error:
+        # Server unreachable: every claimed row backs off together.
+        for email in claimed:
+            _record_failure(email, error, now())
+    else:
+        for email in claimed:
+            try:
+                _message(email, connection).send()
+            except Exception as error:
+                _record_failure(email, error, now())
+            else:
+                email.status = EmailOutbox.Status.SENT
+                email.attempts += 1
+                email.sent_at = now()
+                email.last_error = ""
+                sent += 1
+
+    updated_at = now()
+    for email in claimed:
+        email.updated_at = updated_at
+    EmailOutbox.objects.bulk_update(
+        claimed,
+        ["status", "attempts", "next_attempt_at", "sent_at", "last_error", "updated_at"],
+    )
+    return len(claimed), sent
+
+
+def dispatch_outbox(batch_size=None, max_batches=None):
+    """
+    Send due outbox emails, ``batch_size`` rows per transaction, until none
+    are due or ``max_batches`` have run. Returns the number sent.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    connection = get_connection(fail_silently=False)
+    total = batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            claimed, sent = _dispatch_batch(connection, batch_size)
+            total += sent
+            batches += 1
+            if claimed < batch_size or not sent:
+                break
+    finally:
+        connection.close()
+    return total
@@ -0,0 +1,227 @@
+"""
+Keyset (cursor) pagination for large listings.
+
+``KeysetPagination`` pages on the queryset's own ordering: the cursor
+carries the ordering values of the last row served and the next page is
+``WHERE (ordering) after (cursor) LIMIT page_size + 1``, so every page
+costs the same index range scan however deep it is, and no COUNT(*) runs
+unless the client asks for ``?count=true``. That count is the planner's
+estimate for an unfiltered table on PostgreSQL and otherwise an exact
+count cached for PAGINATION_COUNT_CACHE_TIMEOUT seconds.
+
+Orderings that cannot be paged by key (nullable or related fields,
+expressions, random order) and legacy ``?page=`` requests are served by
+``page_number_class`` instead.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import hashlib
+import json
+import uuid
+from collections import OrderedDict
+from functools import reduce
+from operator import and_, or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_CACHE_PREFIX = "core:pagination:count"
+
+
+class LimitedPageNumberPagination(PageNumberPagination):
+    page_size_query_param = "page_size"
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINATION_MAX_PAGE_SIZE
+
+
+def _encode_value(value):
+    # Full precision: DjangoJSONEncoder drops microseconds, which would
+    # skip or repeat rows sharing a millisecond.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def estimated_count(queryset):
+    """Row count of ``queryset``, and whether it is an estimate."""
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:  # -1 until the table is first analysed
+            return int(row[0]), True
+
+    sql, params = queryset.query.sql_with_params()
+    key = f"{COUNT_CACHE_PREFIX}:{hashlib.sha1(repr((sql, params)).encode()).hexdigest()}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count, False
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+    page_number_class = LimitedPageNumberPagination
+
+    def __init__(self):
+        self.fallback = None
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINATION_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        size = request.query_params.get(self.page_size_query_param)
+        try:
+            size = int(size) if size else settings.REST_FRAMEWORK["PAGE_SIZE"]
+        except ValueError:
+            size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        return max(1, min(size, self.max_page_size))
+
+    def get_keys(self, queryset):
+        """``[(name, attname, descending)]`` for the ordering, or ``None`` if it can't be keyed."""
+        opts = queryset.model._meta
+        ordering = list(queryset.query.order_by)
+        if not ordering or not all(isinstance(item, str) for item in ordering):
+            return None
+
+        keys = []
+        for item in ordering:
+            name = item.lstrip("-")
+            if name == "?" or "__" in name:
+                return None
+            if name == "pk" or name in queryset.query.annotations:
+                attname = name
+            else:
+                try:
+                    field = opts.get_field(name)
+                except FieldDoesNotExist:
+                    return None
+                if field.null or field.is_relation:
+                    return None
+                attname = field.attname
+            keys.append((name, attname, item.startswith("-")))
+
+        # A unique last key so rows sharing the other values keep one order.
+        if not any(name in ("pk", opts.pk.name) for name, _, _ in keys):
+            keys.append(("pk", "pk", False))
+        return keys
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        keys = self.get_keys(queryset)
+        if keys is None or self.page_number_class.page_query_param in request.query_params:
+            self.fallback = self.page_number_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.keys = keys
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        position, reverse = self.decode_cursor(request)
+
+        ordering = [f"{'-' if descending != reverse else ''}{name}" for name, _, descending in keys]
+        page = queryset.order_by(*ordering)
+        if position is not None:
+            page = page.filter(self.after(position, reverse))
+        rows = list(page[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.rows = rows
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true", "True"):
+            self.count, self.count_estimated = estimated_count(queryset)
+        return rows
+
+    def after(self, position, reverse):
+        """Rows strictly after ``position`` in (possibly reversed) key order."""
+        conditions = []
+        for index, (name, _, descending) in enumerate(self.keys):
+            lookup = "lt" if descending != reverse else "gt"
+            equal = [Q(**{key[0]: value}) for key, value in zip(self.keys[:index], position)]
+            conditions.append(reduce(and_, equal, Q(**{f"{name}__{lookup}": position[index]})))
+        return reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor["p"], bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound("Invalid cursor")
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        position = [_encode_value(getattr(row, attname)) for _, attname, _ in self.keys]
+        cursor = {"p": position, "r": 1} if reverse else {"p": position}
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.fallback:
+            return self.fallback.get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.fallback:
+            return self.fallback.get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.fallback:
+            return self.fallback.get_paginated_response(data)
+        body = OrderedDict([("next", self.get_next_link()), ("previous", self.get_previous_link())])
+        if self.count is not None:
+            body["count"] = self.count
+            body["count_estimated"] = self.count_estimated
+        body["results"] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "count": {"type": "integer"},
+                "count_estimated": {"type": "boolean"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,62 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class _Echo:
+    """File-like object whose ``write`` just returns the line ``csv`` formatted."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fields, batch=500):
+    """CSV text for ``rows`` (dicts) in chunks of ``batch`` lines, header first."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([row[field] for field in fields]))
+        if len(lines) >= batch:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def iter_ndjson(rows, batch=500):
+    """One JSON object per line for ``rows``, in chunks of ``batch`` lines."""
+    encoder = DjangoJSONEncoder()
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(row) + "\n")
+        if len(lines) >= batch:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.get("results", [data])
+        if not data:
+            return ""
+        return "".join(iter_csv(data, list(data[0])))
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.get("results", [data])
+        return "".join(iter_ndjson(data))
@@ -0,0 +1,11 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from . import outbox
+
+
+@shared_task
+def dispatch_email_outbox():
+    """Send due outbox emails; queued after commits and swept every minute for retries."""
+    cache.delete(outbox.DISPATCH_SCHEDULED_KEY)  # see schedule_once
+    return outbox.dispatch_outbox()
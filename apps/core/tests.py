@@ -1,3 +1,156 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from apps.library.models import Book, Category, Member
+from apps.users.models import User
+
+from .checks import check_shared_cache
+from .models import EmailOutbox
+from .outbox import dispatch_outbox, enqueue_email
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class EmailOutboxTests(TestCase):
+
+    def test_rolled_back_transaction_queues_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue_email("Welcome", "Hello", ["ada@example.com"])
+            raise RuntimeError
+
+        self.assertFalse(EmailOutbox.objects.exists())
+        self.assertEqual(dispatch_outbox(), 0)
+
+    def test_dispatch_sends_due_emails_in_batches(self):
+        for number in range(5):
+            enqueue_email(f"Welcome {number}", "Hello", [f"member{number}@example.com"])
+
+        self.assertEqual(dispatch_outbox(batch_size=2), 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.Status.SENT).count(), 5)
+        self.assertEqual(dispatch_outbox(), 0)
+
+    @override_settings(EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        email = enqueue_email("Welcome", "Hello", ["ada@example.com"])
+
+        with mock.patch("apps.core.outbox.EmailMessage.send", side_effect=OSError("refused")):
+            self.assertEqual(dispatch_outbox(), 0)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (EmailOutbox.Status.PENDING, 1))
+            self.assertGreater(email.next_attempt_at, now() + timedelta(seconds=50))
+
+            self.assertEqual(dispatch_outbox(), 0)  # not due yet
+            EmailOutbox.objects.update(next_attempt_at=now())
+            dispatch_outbox()
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.Status.FAILED, 2))
+        self.assertIn("refused", email.last_error)
+        self.assertEqual(mail.outbox, [])
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def test_warns_about_process_local_caches(self):
+        local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        shared = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache"}}
+
+        with override_settings(CACHES=local):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ["core.W001"])
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            email="librarian@example.com", name="Librarian", password="password123", role=User.Role.LIBRARIAN,
+        ))
+        members = [
+            Member.objects.create(name=f"Member {number}", membership_id=f"M-{number}", email=f"m{number}@example.com")
+            for number in range(7)
+        ]
+        # Identical created_at: only the pk tie-break orders these rows.
+        Member.objects.update(created_at=now())
+        self.ids = [member.pk for member in members]
+        self.url = reverse("member-list")
+
+    def ids_of(self, response):
+        return [row["id"] for row in response.data["results"]]
+
+    def test_walks_forward_and_back_through_ties(self):
+        pages, response = [], self.client.get(self.url, {"page_size": 3})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(self.ids_of(response))
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(pages, [self.ids[:3], self.ids[3:6], self.ids[6:]])
+        self.assertNotIn("count", response.data)
+
+        backwards = [self.ids_of(response)]
+        while response.data["previous"]:
+            response = self.client.get(response.data["previous"])
+            backwards.append(self.ids_of(response))
+        self.assertEqual(backwards, pages[::-1])
+
+    def test_page_parameter_falls_back_to_page_numbers(self):
+        response = self.client.get(self.url, {"page": 2, "page_size": 3})
+
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(self.ids_of(response), self.ids[3:6])
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ("not-base64!", "eyJwIjogWzFdfQ=="):  # the second is {"p": [1]}: too few keys
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(self.url, {"cursor": cursor}).status_code, 404)
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=2)
+    def test_page_size_is_capped_and_count_is_opt_in(self):
+        response = self.client.get(self.url, {"page_size": 50, "count": "true"})
+
+        self.assertEqual(self.ids_of(response), self.ids[:2])
+        self.assertEqual((response.data["count"], response.data["count_estimated"]), (7, False))
+
+
+class FullTextSearchFallbackTests(TestCase):
+
+    def test_search_falls_back_to_search_fields(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("PostgreSQL searches the tsvector instead")
+        category = Category.objects.create(name="Fiction")
+        dune, emma, children = [
+            Book.objects.create(
+                title=title, author=author, isbn=isbn, category=category, total_copies=1, available_copies=1,
+            )
+            for title, author, isbn in [
+                ("Dune", "Frank Herbert", "9780441013593"),
+                ("Emma", "Jane Austen", "9780141439587"),
+                ("Children of Dune", "Frank Herbert", "9780593098240"),
+            ]
+        ]
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            email="member@example.com", name="Member", password="password123", role=User.Role.MEMBER,
+        ))
+
+        def search(terms):
+            response = client.get(reverse("book-list"), {"search": terms})
+            return {row["id"] for row in response.data["results"]}
+
+        self.assertEqual(search("dune"), {dune.pk, children.pk})
+        self.assertEqual(search("austen"), {emma.pk})
+        self.assertEqual(search("9780141439587"), {emma.pk})
+        self.assertEqual(search("herbert children"), {children.pk})
+        self.assertEqual(search(""), {dune.pk, emma.pk, children.pk})
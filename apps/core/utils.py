@@ -0,0 +1,45 @@
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def read_counter(key):
+    """A cache-held counter shared by every process; starts at 1."""
+    return cache.get_or_set(key, 1, timeout=None)
+
+
+def bump_counter(key, initial=1):
+    """
+    Increment the counter at ``key`` and return the new value. A missing
+    counter counts from ``initial``: ``read_counter``'s 1 by default, 0 for
+    plain tallies.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, initial + 1, timeout=None):
+            return initial + 1
+        return cache.incr(key)  # another process created it first
+
+
+def schedule_once(key, task, delay):
+    """
+    Queue ``task`` to run in ``delay`` seconds unless a run is already
+    queued under ``key``, so a burst of triggers becomes one batched run.
+    The task must delete ``key`` before it starts working: triggers from
+    then on queue a fresh run, earlier ones are covered by the current one.
+    Returns whether a run was queued.
+    """
+    if not cache.add(key, True, timeout=delay):
+        return False
+    try:
+        task.apply_async(countdown=delay, retry=False)
+    except Exception:
+        # Callers back this with a periodic sweep, so a lost kick only
+        # delays the work.
+        logger.exception("Could not queue %s", task.name)
+        cache.delete(key)
+        return False
+    return True
@@ -2,9 +2,11 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Book, Category, Member, BookIssue
+from .models import Book, Category, Member, BookIssue, FineBalance, OverdueNotice
 
 admin.site.register(Book)
 admin.site.register(Category)
 admin.site.register(Member)
 admin.site.register(BookIssue)
+admin.site.register(FineBalance)
+admin.site.register(OverdueNotice)
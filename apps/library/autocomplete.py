@@ -0,0 +1,148 @@
+"""
+In-process prefix index for title/author typeahead.
+
+Every process keeps three sorted key lists: whole titles, each later word
+of a title onward ("potter and the..." for "Harry Potter and the..."),
+and authors. A prefix lookup is a ``bisect`` into each, taken in that
+order, so answering costs O(log n + limit) and never touches the
+database. After ``bump_generation`` signals a title or author change (from
+``post_save``, or from the embedding sweep for books that were
+``bulk_create()``d) the lists are rebuilt on a background thread while
+the old ones keep serving.
+"""
+import logging
+import threading
+from bisect import bisect_left
+
+from django.db import connection
+
+from apps.core.utils import bump_counter, read_counter
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "library:autocomplete:generation"
+
+
+def current_generation():
+    return read_counter(GENERATION_KEY)
+
+
+def bump_generation():
+    return bump_counter(GENERATION_KEY)
+
+
+def normalize_prefix(text):
+    return " ".join(text.lower().split())
+
+
+class _Keys:
+    """Sorted ``keys`` with the book id of each in ``ids``."""
+
+    def __init__(self, pairs):
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.ids = [book_id for _, book_id in pairs]
+
+    def matches(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        for position in range(start, len(self.keys)):
+            if not self.keys[position].startswith(prefix):
+                return
+            yield self.ids[position]
+
+
+class PrefixIndex:
+    def __init__(self, rows, generation=0):
+        self.generation = generation
+        self.books = {}
+        titles, words, authors = [], [], []
+        for book_id, title, author in rows:
+            self.books[book_id] = (title, author)
+            title_key = normalize_prefix(title)
+            titles.append((title_key, book_id))
+            offset = title_key.find(" ")
+            while offset != -1:
+                words.append((title_key[offset + 1:], book_id))
+                offset = title_key.find(" ", offset + 1)
+            authors.append((normalize_prefix(author), book_id))
+        self.sections = [_Keys(titles), _Keys(words), _Keys(authors)]
+
+    @classmethod
+    def build(cls, generation=0, chunk_size=5000):
+        rows = Book.objects.values_list("id", "title", "author").iterator(chunk_size=chunk_size)
+        return cls(rows, generation)
+
+    def search(self, prefix, limit=10):
+        """``[{"id", "title", "author"}]`` for up to ``limit`` books, best first."""
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+
+        found = []
+        seen = set()
+        for section in self.sections:
+            for book_id in section.matches(prefix):
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                title, author = self.books[book_id]
+                found.append({"id": book_id, "title": title, "author": author})
+                if len(found) >= limit:
+                    return found
+        return found
+
+
+_index = None
+_building = False
+_lock = threading.Lock()
+
+
+def _rebuild(generation):
+    """Build indexes in the background until one matches the current generation."""
+    global _index, _building
+
+    try:
+        while True:
+            index = PrefixIndex.build(generation)
+            with _lock:
+                _index = index
+                latest = current_generation()
+                if latest == generation:
+                    _building = False
+                    return
+            generation = latest
+    except Exception:
+        logger.exception("Could not rebuild the autocomplete index")
+        with _lock:
+            _building = False
+    finally:
+        connection.close()
+
+
+def get_prefix_index():
+    """
+    The process' prefix index. Only the very first call builds inline; after
+    a catalogue change the previous index keeps answering while a background
+    thread builds its replacement, so requests never wait on a rebuild.
+    """
+    global _index, _building
+
+    generation = current_generation()
+    index = _index
+    if index is not None and index.generation == generation:
+        return index
+
+    with _lock:
+        if _index is None:
+            _index = PrefixIndex.build(generation)
+        elif _index.generation != generation and not _building:
+            _building = True
+            threading.Thread(target=_rebuild, args=(generation,), daemon=True).start()
+        return _index
+
+
+def reset_prefix_index():
+    global _index
+    with _lock:
+        _index = None
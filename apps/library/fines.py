@@ -0,0 +1,109 @@
+"""
+Fine accrual and per-member balances.
+
+``accrue_fines`` brings every open overdue loan's ``fine_amount`` up to
+date in one UPDATE and then recomputes the balances of the members
+concerned. Returns move a loan's fine from accrued to final through
+``adjust_fine_balances``, so ``FineBalance`` never needs a full rescan.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, DateField, DecimalField, F, Func, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from .models import BookIssue, FineBalance
+
+FINE_PER_DAY = 5  # simple rule-based automation
+
+
+class DaysBetween(Func):
+    """Whole days from the second date expression to the first."""
+
+    template = "(%(expressions)s)"  # date - date is an integer on PostgreSQL
+    arg_joiner = " - "
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="DATEDIFF(%(expressions)s)", arg_joiner=", ", **extra_context)
+
+
+def fine_for(return_date, due_date):
+    return max(0, (return_date - due_date).days) * FINE_PER_DAY
+
+
+def _ensure_balances(member_ids):
+    FineBalance.objects.bulk_create(
+        [FineBalance(member_id=member_id) for member_id in member_ids],
+        ignore_conflicts=True,
+    )
+
+
+def adjust_fine_balances(deltas):
+    """Add ``{member_id: amount}`` to members' balances in one UPDATE."""
+    deltas = {member_id: Decimal(delta) for member_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    _ensure_balances(deltas)
+    FineBalance.objects.filter(member_id__in=list(deltas)).update(
+        balance=F("balance") + Case(
+            *[When(member_id=member_id, then=Value(delta)) for member_id, delta in deltas.items()],
+            default=Value(Decimal(0)),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        updated_at=now(),
+    )
+
+
+def recompute_fine_balances(member_ids=None):
+    """
+    Set balances to the sum of each member's loan fines with one correlated
+    UPDATE; all members when ``member_ids`` is ``None``. Returns rows updated.
+    """
+    if member_ids is None:
+        member_ids = list(BookIssue.objects.values_list("member_id", flat=True).distinct())
+    member_ids = list(member_ids)
+    _ensure_balances(member_ids)
+
+    totals = (
+        BookIssue.objects
+        .filter(member_id=OuterRef("member_id"))
+        .values("member_id")
+        .annotate(total=Sum("fine_amount"))
+        .values("total")
+    )
+    return FineBalance.objects.filter(member_id__in=member_ids).update(
+        balance=Coalesce(Subquery(totals), Value(Decimal(0)), output_field=DecimalField(max_digits=10, decimal_places=2)),
+        updated_at=now(),
+    )
+
+
+@transaction.atomic
+def accrue_fines(today=None):
+    """
+    Nightly: set ``fine_amount`` on every open overdue loan to what it would
+    be if returned ``today``, as a single UPDATE. Idempotent, so a missed or
+    repeated run does no harm. Returns the number of loans updated.
+    """
+    today = today or now().date()
+    overdue = BookIssue.objects.filter(return_date__isnull=True, due_date__lt=today)
+
+    updated = overdue.update(
+        fine_amount=DaysBetween(Value(today, output_field=DateField()), F("due_date")) * FINE_PER_DAY,
+        updated_at=now(),
+    )
+    if updated:
+        recompute_fine_balances(overdue.values_list("member_id", flat=True).distinct())
+    return updated
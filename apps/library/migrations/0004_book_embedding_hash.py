@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_remove_member_user_alter_member_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='embedding_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+    ]
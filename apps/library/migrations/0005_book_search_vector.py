@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:50
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Must match FullTextSearchFilter.search_config.
+CREATE_SQL = """
+CREATE FUNCTION library_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.author, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER library_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, search_vector ON library_book
+    FOR EACH ROW EXECUTE FUNCTION library_book_search_vector_update();
+
+UPDATE library_book SET search_vector =
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(author, '')), 'B');
+
+CREATE INDEX library_book_search_vector_gin ON library_book USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS library_book_search_vector_gin;
+DROP TRIGGER IF EXISTS library_book_search_vector_trigger ON library_book;
+DROP FUNCTION IF EXISTS library_book_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
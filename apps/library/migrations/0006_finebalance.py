@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_balances(apps, schema_editor):
+    BookIssue = apps.get_model("library", "BookIssue")
+    FineBalance = apps.get_model("library", "FineBalance")
+    totals = (
+        BookIssue.objects
+        .values("member_id")
+        .annotate(total=models.Sum("fine_amount"))
+        .filter(total__gt=0)
+        .values_list("member_id", "total")
+    )
+    FineBalance.objects.bulk_create(
+        (FineBalance(member_id=member_id, balance=total) for member_id, total in totals.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FineBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('balance', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10)),
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fine_balance', to='library.member')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_finebalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_on', models.DateField()),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_notices', to='library.bookissue')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('issue', 'sent_on'), name='unique_overdue_notice_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_overduenotice'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['due_date'], name='bookissue_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(fields=['member', 'issue_date'], name='bookissue_member_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(fields=['book', 'return_date'], name='bookissue_book_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['email'], name='member_email_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_circulation_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-created_at', 'id'], name='book_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['-created_at', 'id'], name='member_created_id_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 
-from apps.core.models import BaseModel
+from apps.core.models import BaseModel, TimeStampedModel
 
 class Category(BaseModel):
     name = models.CharField(max_length=100, unique=True)
@@ -10,9 +11,6 @@ class Category(BaseModel):
         return self.name
 
 
-from transformers import AutoTokenizer, AutoModel
-import torch
-
 class Book(BaseModel):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255)
@@ -21,6 +19,25 @@ class Book(BaseModel):
     total_copies = models.PositiveIntegerField()
     available_copies = models.PositiveIntegerField()
     embedding = models.BinaryField(null=True, blank=True)  # store serialized embedding
+    # sha1 of the embedded text + model id; unchanged books are skipped on re-embed
+    embedding_hash = models.CharField(max_length=40, blank=True, default="", db_index=True)
+    # Weighted title (A) / author (B) tsvector. On PostgreSQL a trigger keeps
+    # it current and a GIN index serves ?search= (migration 0005); elsewhere
+    # it stays NULL and search falls back to icontains.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the default ('-created_at', 'id') listing.
+            models.Index(fields=["-created_at", "id"], name="book_created_id_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember what was read so post_save can tell what a save changed.
+        book = super().from_db(db, field_names, values)
+        book._loaded_values = {name: book.__dict__[name] for name in field_names}
+        return book
 
 
 
@@ -30,6 +47,12 @@ class Member(BaseModel):
     email = models.EmailField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["email"], name="member_email_idx"),
+            models.Index(fields=["-created_at", "id"], name="member_created_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -42,6 +65,43 @@ class BookIssue(BaseModel):
     return_date = models.DateField(null=True, blank=True)
     fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            # Overdue scans: only open loans are indexed, so its size tracks
+            # current circulation rather than the whole history.
+            models.Index(
+                fields=["due_date"],
+                condition=models.Q(return_date__isnull=True),
+                name="bookissue_open_due_idx",
+            ),
+            models.Index(fields=["member", "issue_date"], name="bookissue_member_issued_idx"),
+            models.Index(fields=["book", "return_date"], name="bookissue_book_returned_idx"),
+        ]
+
     @property
     def is_overdue(self):
         return self.return_date is None and self.due_date < models.functions.Now()
+
+
+class OverdueNotice(models.Model):
+    """One overdue reminder sent for a loan; stops the same loan being nagged daily."""
+    issue = models.ForeignKey(BookIssue, on_delete=models.CASCADE, related_name="overdue_notices")
+    sent_on = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["issue", "sent_on"], name="unique_overdue_notice_per_day"),
+        ]
+
+
+class FineBalance(TimeStampedModel):
+    """
+    Sum of a member's fines: accrued nightly on open loans, settled on
+    return. Kept up to date by ``apps.library.fines`` so balance lookups
+    and "owes more than X" reports are indexed reads.
+    """
+    member = models.OneToOneField(Member, on_delete=models.CASCADE, related_name="fine_balance")
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.member} owes {self.balance}"
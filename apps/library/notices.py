@@ -0,0 +1,80 @@
+"""
+Batched overdue reminders.
+
+Open overdue loans without a recent ``OverdueNotice`` are streamed in
+member order with their member and book joined in, folded into one email
+per member, and sent ``chunk_size`` emails at a time over a single SMTP
+connection. Notices are recorded after each chunk is accepted, so a
+failure part-way through only re-sends the chunk that failed.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+
+from .models import BookIssue, OverdueNotice
+
+
+def pending_overdue_issues(today=None):
+    """Open overdue loans not reminded about in the last OVERDUE_NOTICE_INTERVAL_DAYS."""
+    today = today or now().date()
+    recent = OverdueNotice.objects.filter(
+        issue=OuterRef("pk"),
+        sent_on__gt=today - timedelta(days=settings.OVERDUE_NOTICE_INTERVAL_DAYS),
+    )
+    return (
+        BookIssue.objects
+        .filter(return_date__isnull=True, due_date__lt=today)
+        .exclude(Exists(recent))
+        .select_related("member", "book")
+        .only("id", "due_date", "member__name", "member__email", "book__title")
+        .order_by("member_id", "due_date", "id")
+    )
+
+
+def overdue_message(member, issues, connection=None):
+    lines = "\n".join(f"- '{issue.book.title}' (due {issue.due_date:%Y-%m-%d})" for issue in issues)
+    return EmailMessage(
+        subject="Library Due Date Reminder",
+        body=f"{member.name}, please return the following overdue books:\n{lines}",
+        to=[member.email],
+        connection=connection,
+    )
+
+
+def send_overdue_notices(today=None, chunk_size=None):
+    """Send one reminder per member with overdue loans. Returns emails sent."""
+    today = today or now().date()
+    chunk_size = chunk_size or settings.OVERDUE_NOTICE_CHUNK_SIZE
+    issues = pending_overdue_issues(today).iterator(chunk_size=chunk_size * 10)
+    sent = 0
+
+    with get_connection() as connection:
+        messages, issue_ids = [], []
+
+        def flush():
+            nonlocal sent
+            sent += connection.send_messages(messages) or 0
+            OverdueNotice.objects.bulk_create(
+                [OverdueNotice(issue_id=issue_id, sent_on=today) for issue_id in issue_ids],
+                ignore_conflicts=True,
+            )
+            messages.clear()
+            issue_ids.clear()
+
+        for _, group in groupby(issues, key=lambda issue: issue.member_id):
+            group = list(group)
+            member = group[0].member
+            if not member.email:
+                continue
+            messages.append(overdue_message(member, group, connection))
+            issue_ids.extend(issue.pk for issue in group)
+            if len(messages) >= chunk_size:
+                flush()
+        if messages:
+            flush()
+
+    return sent
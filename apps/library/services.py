@@ -1,104 +1,443 @@
 from datetime import timedelta
+import numpy as np
 from django.utils.timezone import now
 from django.db import transaction
-from .models import Book, BookIssue
-
-FINE_PER_DAY = 5  # simple rule-based automation
+from django.db.models import Case, F, IntegerField, Value, When
+from apps.ai_engine import recommendation_cache
+from apps.ai_engine.collaborative import collaborative_scores
+from apps.ai_engine.index import mark_availability
+from apps.ai_engine.models import MemberRecommendation
+from apps.ai_engine.services import (
+    add_to_taste,
+    add_to_tastes,
+    fallback_book_ids,
+    lock_tastes,
+    member_history,
+)
+from .fines import adjust_fine_balances, fine_for
+from .models import Book, BookIssue, Member
 
 @transaction.atomic
 def issue_book(book: Book, member):
-    if book.available_copies <= 0:
-        raise ValueError("No copies available")
-
-    book.available_copies -= 1
-    book.save()
-
-    return BookIssue.objects.create(
+    add_to_taste(member.pk, book.pk, book.embedding)
+    issue = BookIssue.objects.create(
         book=book,
         member=member,
         due_date=now().date() + timedelta(days=14)
     )
 
+    # Conditional UPDATE, last so a popular book's row lock is only held
+    # until commit: of two concurrent checkouts of the last copy only one
+    # still matches available_copies > 0; the other raises and its loan
+    # and taste update roll back.
+    taken = Book.objects.filter(pk=book.pk, available_copies__gt=0).update(
+        available_copies=F("available_copies") - 1,
+        updated_at=now(),
+    )
+    if not taken:
+        raise ValueError("No copies available")
+    book.refresh_from_db(fields=["available_copies", "updated_at"])
+
+    transaction.on_commit(lambda: forget_member_recommendations(member.pk))
+    if book.available_copies == 0:
+        transaction.on_commit(lambda: mark_availability(book.pk, False))
+    return issue
+
 
 @transaction.atomic
 def return_book(issue: BookIssue):
-    if issue.return_date:
+    # Lock the open loan and read what the nightly job has accrued on it,
+    # so the member's balance moves by exactly the difference.
+    accrued = (
+        BookIssue.objects
+        .select_for_update()
+        .filter(pk=issue.pk, return_date__isnull=True)
+        .values_list("fine_amount", flat=True)
+        .first()
+    )
+    if accrued is None:
         raise ValueError("Book already returned")
 
-    issue.return_date = now().date()
-
-    overdue_days = max(0, (issue.return_date - issue.due_date).days)
-    issue.fine_amount = overdue_days * FINE_PER_DAY
-    issue.save()
+    return_date = now().date()
+    fine_amount = fine_for(return_date, issue.due_date)
+    BookIssue.objects.filter(pk=issue.pk).update(
+        return_date=return_date,
+        fine_amount=fine_amount,
+        updated_at=now(),
+    )
+    adjust_fine_balances({issue.member_id: fine_amount - accrued})
+    issue.return_date = return_date
+    issue.fine_amount = fine_amount
 
+    Book.objects.filter(pk=issue.book_id).update(
+        available_copies=F("available_copies") + 1,
+        updated_at=now(),
+    )
     book = issue.book
-    book.available_copies += 1
-    book.save()
+    book.refresh_from_db(fields=["available_copies", "updated_at"])
 
+    transaction.on_commit(lambda: forget_member_recommendations(issue.member_id))
+    if book.available_copies == 1:
+        transaction.on_commit(lambda: mark_availability(book.pk, True))
     return issue
 
 
-from django.core.mail import send_mail
+def _counter_delta(counts):
+    """``CASE id WHEN ... THEN n`` for a one-statement update of many books."""
+    return Case(
+        *[When(pk=book_id, then=Value(count)) for book_id, count in counts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+@transaction.atomic
+def issue_books(items):
+    """
+    Issue many ``(book_id, member_id)`` pairs in one transaction with a
+    fixed number of queries. Returns one ``(issue, error)`` per item, in
+    order; a book runs out when its copies are exhausted, earlier items
+    first.
+    """
+    items = list(items)
+    members = Member.objects.in_bulk({member_id for _, member_id in items})
+    lock_tastes(members)  # before the books, as in issue_book
+    books = {
+        book.pk: book
+        for book in Book.objects.select_for_update().filter(
+            pk__in={book_id for book_id, _ in items}
+        ).order_by("pk")
+    }
 
-def send_overdue_email(issue):
-    send_mail(
-        subject="Library Due Date Reminder",
-        message=f"{issue.member.name}, please return '{issue.book.title}'.",
-        from_email=None,
-        recipient_list=[issue.member.email],
-        fail_silently=True,
+    remaining = {book_id: book.available_copies for book_id, book in books.items()}
+    results, granted = [], []
+    for book_id, member_id in items:
+        if book_id not in books:
+            results.append((None, "Book not found"))
+        elif member_id not in members:
+            results.append((None, "Member not found"))
+        elif remaining[book_id] <= 0:
+            results.append((None, "No copies available"))
+        else:
+            remaining[book_id] -= 1
+            granted.append(len(results))
+            results.append(None)
+    if not granted:
+        return results
+
+    taken = {book_id: books[book_id].available_copies - left for book_id, left in remaining.items()}
+    taken = {book_id: count for book_id, count in taken.items() if count}
+    Book.objects.filter(pk__in=list(taken)).update(
+        available_copies=F("available_copies") - _counter_delta(taken),
+        updated_at=now(),
+    )
+
+    pairs = [items[position] for position in granted]
+    add_to_tastes([(member_id, book_id, books[book_id].embedding) for book_id, member_id in pairs])
+    due_date = now().date() + timedelta(days=14)
+    issues = BookIssue.objects.bulk_create(
+        [BookIssue(book_id=book_id, member_id=member_id, due_date=due_date) for book_id, member_id in pairs]
+    )
+
+    for position, issue in zip(granted, issues):
+        results[position] = (issue, None)
+
+    member_ids = {member_id for _, member_id in pairs}
+    transaction.on_commit(lambda: forget_recommendations(member_ids))
+    for book_id, left in remaining.items():
+        if left == 0 and book_id in taken:
+            transaction.on_commit(lambda book_id=book_id: mark_availability(book_id, False))
+    return results
+
+
+@transaction.atomic
+def return_books(issue_ids):
+    """
+    Return many loans by id in one transaction with a fixed number of
+    queries. Returns one ``(issue, error)`` per id, in order.
+    """
+    issue_ids = list(issue_ids)
+    issues = {
+        issue.pk: issue
+        for issue in BookIssue.objects.select_for_update().filter(pk__in=set(issue_ids)).order_by("pk")
+    }
+
+    return_date = now().date()
+    results, closing, fines = [], {}, {}
+    for issue_id in issue_ids:
+        issue = issues.get(issue_id)
+        if issue is None:
+            results.append((None, "Issue not found"))
+        elif issue.return_date or issue_id in closing:
+            results.append((None, "Book already returned"))
+        else:
+            fine_amount = fine_for(return_date, issue.due_date)
+            fines[issue.member_id] = fines.get(issue.member_id, 0) + fine_amount - issue.fine_amount
+            issue.return_date = return_date
+            issue.fine_amount = fine_amount
+            issue.updated_at = now()
+            closing[issue_id] = issue
+            results.append((issue, None))
+    if not closing:
+        return results
+
+    BookIssue.objects.bulk_update(list(closing.values()), ["return_date", "fine_amount", "updated_at"])
+    adjust_fine_balances(fines)
+
+    returned = {}
+    for issue in closing.values():
+        returned[issue.book_id] = returned.get(issue.book_id, 0) + 1
+    restocked = set(
+        Book.objects.select_for_update()
+        .filter(pk__in=list(returned), available_copies=0)
+        .values_list("pk", flat=True)
     )
+    Book.objects.filter(pk__in=list(returned)).update(
+        available_copies=F("available_copies") + _counter_delta(returned),
+        updated_at=now(),
+    )
+
+    member_ids = {issue.member_id for issue in closing.values()}
+    transaction.on_commit(lambda: forget_recommendations(member_ids))
+    for book_id in restocked:
+        transaction.on_commit(lambda book_id=book_id: mark_availability(book_id, True))
+    return results
+
+
+from apps.core.outbox import enqueue_email
+from apps.core.utils import schedule_once
 
 
 def send_welcome_email(member):
-    send_mail(
+    """Queue the welcome email; it is sent after the signup transaction commits."""
+    enqueue_email(
         subject="Welcome to the Library",
-        message=f"Welcome {member.name}! Thank you for joining our library.",
-        from_email=None,
-        recipient_list=[member.email],
-        fail_silently=True,
+        body=f"Welcome {member.name}! Thank you for joining our library.",
+        to=[member.email],
     )
 
 
 # library_lms/apps/library/services.py
 
-from sentence_transformers import SentenceTransformer
-import pickle
-import numpy as np
-from .models import Book
+import hashlib
+from django.conf import settings
+from apps.ai_engine.embeddings import encode_embedding
+from apps.ai_engine.embeddings import normalize
+from apps.ai_engine.encoder import encode_query, encode_texts
+from apps.ai_engine.index import bump_generation, get_index, patch_index
+from . import autocomplete
+from .models import Book, BookIssue
 
-# Initialize model (singleton)
-model = SentenceTransformer('all-MiniLM-L6-v2')
 
-def generate_book_embeddings():
-    for book in Book.objects.all():
-        emb = model.encode(book.title + " " + book.author)
-        book.embedding = pickle.dumps(emb)
-        book.save()
+def book_embedding_text(book):
+    return book.title + " " + book.author
 
-def recommend_books_for_member(member, top_k=5):
-    issued_books = member.bookissue_set.all()
-    issued_embeddings = []
 
-    for issue in issued_books:
-        if issue.book.embedding:
-            emb = pickle.loads(issue.book.embedding)
-            issued_embeddings.append(emb)
+def embedding_hash(text, model_id=None):
+    model_id = model_id or settings.EMBEDDING_MODEL_NAME
+    return hashlib.sha1(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
 
-    if not issued_embeddings:
-        return Book.objects.all()[:top_k]  # fallback
 
-    avg_embedding = np.mean(issued_embeddings, axis=0)
+def _embed_batch(pending, batch_size, reuse=True):
+    """
+    Fill in ``embedding`` for ``(book, text, digest)`` rows and write them
+    back in one ``bulk_update``. A text is encoded once per batch, and with
+    ``reuse`` not at all if another book already stores a vector for the
+    same hash (e.g. another edition).
+    """
+    known = {}
+    if reuse:
+        known = dict(
+            Book.objects
+            .filter(embedding_hash__in={digest for _, _, digest in pending}, embedding__isnull=False)
+            .values_list("embedding_hash", "embedding")
+        )
 
-    books = Book.objects.exclude(bookissue__member=member)
-    scores = []
+    texts = {text: digest for _, text, digest in pending if digest not in known}
+    if texts:
+        vectors = encode_texts(texts, batch_size=batch_size)
+        for digest, vector in zip(texts.values(), vectors):
+            known[digest] = encode_embedding(vector)
 
+    books = []
+    for book, _, digest in pending:
+        book.embedding = known[digest]
+        book.embedding_hash = digest
+        books.append(book)
+    Book.objects.bulk_update(books, ["embedding", "embedding_hash"])
+    return len(texts)
+
+
+def generate_book_embeddings(queryset=None, batch_size=None, chunk_size=2000, force=False):
+    """
+    Embed books whose title/author or model changed since their last run.
+
+    Books are streamed, encoded ``batch_size`` at a time and written back in
+    bulk. Returns ``(updated, encoded)``: rows written and texts actually
+    sent through the model.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    queryset = Book.objects.all() if queryset is None else queryset
+    updated_ids = []
+    encoded = 0
+    pending = []
+
+    books = queryset.only("id", "title", "author", "embedding_hash").iterator(chunk_size=chunk_size)
     for book in books:
-        if book.embedding:
-            emb = pickle.loads(book.embedding)
-            score = np.dot(avg_embedding, emb) / (np.linalg.norm(avg_embedding) * np.linalg.norm(emb))
-            scores.append((score, book))
-
-    scores.sort(reverse=True, key=lambda x: x[0])
-    recommended_books = [b for s, b in scores[:top_k]]
-    return recommended_books
+        text = book_embedding_text(book)
+        digest = embedding_hash(text)
+        if not force and book.embedding_hash == digest:
+            continue
+
+        pending.append((book, text, digest))
+        if len(pending) >= batch_size:
+            encoded += _embed_batch(pending, batch_size, reuse=not force)
+            updated_ids.extend(book.pk for book, _, _ in pending)
+            pending = []
+
+    if pending:
+        encoded += _embed_batch(pending, batch_size, reuse=not force)
+        updated_ids.extend(book.pk for book, _, _ in pending)
+
+    if len(updated_ids) > settings.EMBEDDING_INDEX_PATCH_LIMIT:
+        bump_generation()
+    elif updated_ids:
+        patch_index(updated_ids)
+    if updated_ids:
+        # Books bulk_create()d by imports reach the typeahead here: this
+        # sweep is the first code to see them, as no signal fired.
+        autocomplete.bump_generation()
+    return len(updated_ids), encoded
+
+
+EMBEDDING_REFRESH_SCHEDULED_KEY = "library:embedding_refresh:scheduled"
+
+
+def schedule_embedding_refresh():
+    """
+    Queue one delayed ``embed_pending_books`` run for every save in the
+    next EMBEDDING_REFRESH_DELAY seconds, so bulk imports become a few
+    batched tasks rather than one encode per book.
+    """
+    from apps.ai_engine.tasks import embed_pending_books
+
+    # A lost kick leaves books marked (empty embedding_hash) for the next
+    # scheduled run or `manage.py generate_book_embeddings`.
+    schedule_once(EMBEDDING_REFRESH_SCHEDULED_KEY, embed_pending_books, settings.EMBEDDING_REFRESH_DELAY)
+
+
+def forget_member_recommendations(member_id):
+    """Drop cached and materialized recommendations after a circulation event."""
+    recommendation_cache.invalidate_member(member_id)
+    MemberRecommendation.objects.filter(member_id=member_id).delete()
+
+
+def forget_recommendations(member_ids):
+    """``forget_member_recommendations`` for many members at once."""
+    member_ids = list(member_ids)
+    recommendation_cache.invalidate_members(member_ids)
+    MemberRecommendation.objects.filter(member_id__in=member_ids).delete()
+
+
+def recommend_books_for_member(member, top_k=5, available_only=False, category=None):
+    index = get_index()
+
+    if available_only or category is not None:
+        # Filtered lists follow circulation, so they are scored live; the
+        # masks make that as cheap as an unfiltered search.
+        mask = index.filter_mask(available_only=available_only, category=category)
+        book_ids = _recommended_book_ids(index, member, top_k, mask=mask)
+        books = Book.objects.in_bulk(book_ids)
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    book_ids = recommendation_cache.get_recommendations(member.pk, index.generation, top_k)
+    if book_ids is None:
+        book_ids = _materialized_book_ids(member, top_k)
+        if book_ids is None:
+            book_ids = _recommended_book_ids(index, member, top_k)
+        recommendation_cache.set_recommendations(member.pk, index.generation, top_k, book_ids)
+
+    books = Book.objects.in_bulk(book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+def _materialized_book_ids(member, top_k):
+    """Ids from the nightly ``materialize_recommendations`` run, if it covers ``top_k``."""
+    book_ids = (
+        MemberRecommendation.objects
+        .filter(member_id=member.pk)
+        .values_list("book_ids", flat=True)
+        .first()
+    )
+    if book_ids is None or len(book_ids) < top_k:
+        return None
+    return book_ids[:top_k]
+
+
+def _recommended_book_ids(index, member, top_k, mask=None):
+    # One MemberTaste row, not the member's whole loan history.
+    profile, issued_book_ids = member_history(member.pk)
+    if profile is None or profile.shape[0] != index.dim:
+        profile = index.profile(issued_book_ids)
+
+    weight = settings.RECOMMENDATION_CF_WEIGHT
+    neighbours = collaborative_scores(issued_book_ids) if weight and issued_book_ids else {}
+    if mask is not None and neighbours:
+        allowed = index.lookup(mask, list(neighbours))
+        neighbours = {book_id: neighbours[book_id] for book_id, ok in zip(list(neighbours), allowed) if ok}
+
+    if profile is None and not neighbours:
+        if mask is not None:
+            candidates = index.ids[mask]
+            return candidates[~np.isin(candidates, issued_book_ids)][:top_k].tolist()
+        return fallback_book_ids(top_k, exclude_ids=issued_book_ids)
+    if profile is None:
+        return sorted(neighbours, key=neighbours.get, reverse=True)[:top_k]
+
+    pool = top_k * settings.RECOMMENDATION_CF_CANDIDATES if neighbours else top_k
+    book_ids, scores = index.search(profile, top_k=pool, exclude_ids=issued_book_ids, mask=mask)
+    if not neighbours:
+        return book_ids.tolist()
+    return _blend(index, profile, book_ids, scores, neighbours, issued_book_ids, weight, top_k)
+
+
+def _blend(index, profile, book_ids, scores, neighbours, issued_book_ids, weight, top_k):
+    """
+    Mix content similarity with item-item co-borrowing scores (scaled to
+    0..1) as ``(1 - weight) * content + weight * collaborative`` over the
+    union of both candidate sets.
+    """
+    content = dict(zip(book_ids.tolist(), scores.tolist()))
+
+    issued = set(issued_book_ids)
+    extra = [book_id for book_id in neighbours if book_id not in content and book_id not in issued]
+    rows = index.positions(extra)
+    if len(rows):
+        content.update(zip(index.ids[rows].tolist(), (index.matrix[rows] @ profile).tolist()))
+
+    top = max(neighbours.values())
+    combined = {
+        book_id: (1 - weight) * content.get(book_id, 0.0) + weight * neighbours.get(book_id, 0.0) / top
+        for book_id in set(content) | set(extra)
+    }
+    return sorted(combined, key=combined.get, reverse=True)[:top_k]
+
+
+def semantic_search(query, top_k=10, category=None, available_only=False):
+    """
+    Books closest in meaning to ``query``, best first, as ``(book, score)``.
+    Filters are applied inside the index search, see ``filter_mask``.
+    """
+    index = get_index()
+    vector = normalize(encode_query(query))
+    if not len(index) or vector.shape[0] != index.dim:
+        return []
+
+    mask = index.filter_mask(available_only=available_only, category=category)
+    book_ids, scores = index.search(vector, top_k=top_k, mask=mask)
+    books = Book.objects.in_bulk(book_ids.tolist())
+    return [
+        (books[book_id], score)
+        for book_id, score in zip(book_ids.tolist(), scores.tolist())
+        if book_id in books
+    ]
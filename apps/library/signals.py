@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.ai_engine.index import mark_availability, patch_index
+from . import autocomplete
+from .models import Book
+from .services import book_embedding_text, embedding_hash, schedule_embedding_refresh
+
+TEXT_FIELDS = {"title", "author", "embedding_hash"}
+VECTOR_FIELDS = {"embedding", "category_id"}
+TRACKED_FIELDS = TEXT_FIELDS | VECTOR_FIELDS | {"available_copies"}
+
+_UNKNOWN = object()
+
+
+def _changed_fields(instance, update_fields):
+    """
+    ``{attname: previous value}`` for the TRACKED_FIELDS this save wrote
+    with a new value; ``_UNKNOWN`` when the instance wasn't loaded from
+    the database (a new book, say) and every written field counts.
+    """
+    written = TRACKED_FIELDS
+    if update_fields is not None:
+        written = {Book._meta.get_field(name).attname for name in update_fields} & TRACKED_FIELDS
+
+    loaded = getattr(instance, "_loaded_values", {})
+    changed = {}
+    for name in written:
+        previous = loaded.get(name, _UNKNOWN)
+        if previous is _UNKNOWN or previous != getattr(instance, name):
+            changed[name] = previous
+    instance._loaded_values = {**loaded, **{name: getattr(instance, name) for name in written}}
+    return changed
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, update_fields=None, **kwargs):
+    changed = _changed_fields(instance, update_fields)
+    if not changed:
+        return
+
+    # The stored hash covers title + author, so a match means neither changed
+    # and the typeahead lists are still valid.
+    text_changed = bool(
+        TEXT_FIELDS & changed.keys()
+        and embedding_hash(book_embedding_text(instance)) != instance.embedding_hash
+    )
+    if created or text_changed:
+        transaction.on_commit(autocomplete.bump_generation)
+
+    if text_changed:
+        # New book, or title/author edited: queue it for the next batched
+        # embedding run (which picks up books with an empty hash).
+        if instance.embedding_hash:
+            Book.objects.filter(pk=instance.pk).update(embedding_hash="")
+            instance.embedding_hash = instance._loaded_values["embedding_hash"] = ""
+        transaction.on_commit(schedule_embedding_refresh)
+
+    if VECTOR_FIELDS & changed.keys():
+        # A brand new book has nothing to patch in until it has been embedded.
+        if not created or instance.embedding is not None:
+            transaction.on_commit(lambda: patch_index([instance.pk]))
+    elif "available_copies" in changed:
+        # Copy counts (a PATCH of total/available copies) only move the
+        # availability mask; the vectors and cached recommendations stay.
+        previous = changed["available_copies"]
+        available = instance.available_copies > 0
+        if previous is _UNKNOWN or (previous > 0) != available:
+            transaction.on_commit(lambda: mark_availability(instance.pk, available))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    book_id = instance.pk  # cleared on the instance once the delete finishes
+    transaction.on_commit(lambda: patch_index([book_id]))
+    transaction.on_commit(autocomplete.bump_generation)
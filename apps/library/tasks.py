@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import fines
+
+
+@shared_task
+def accrue_fines():
+    """Nightly: bring fines on open overdue loans and member balances up to date."""
+    return fines.accrue_fines()
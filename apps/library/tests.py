@@ -1,3 +1,341 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import time
 
-# Create your tests here.
+from datetime import date, timedelta
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import DateField, F, Sum, Value
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from apps.users.models import User
+
+from . import autocomplete
+from .fines import FINE_PER_DAY, DaysBetween, accrue_fines
+from .models import Book, BookIssue, Category, FineBalance, Member, OverdueNotice
+from .notices import send_overdue_notices
+from .services import generate_book_embeddings, return_book, return_books
+
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "sklearn")
+
+IMPORT_PROBE = """
+import sys, time
+import django
+start = time.perf_counter()
+django.setup()
+import apps.library.models, apps.library.services, apps.api.urls
+print(time.perf_counter() - start, *(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+class ImportBudgetTests(SimpleTestCase):
+    """Importing the app must not pull in the ML stack; it loads on first encode."""
+
+    IMPORT_BUDGET_SECONDS = 3.0
+
+    def test_import_does_not_load_ml_stack(self):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(modules=HEAVY_MODULES)],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "EMBEDDING_WARM_UP": ""},
+            check=True,
+        )
+        elapsed, *loaded = result.stdout.strip().splitlines()[-1].split()
+
+        self.assertEqual(loaded, [], f"imported at startup: {loaded}")
+        self.assertLess(float(elapsed), self.IMPORT_BUDGET_SECONDS)
+
+
+class CirculationIndexTests(TestCase):
+    """The hot circulation queries must be answerable from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Fiction")
+        cls.book = Book.objects.create(
+            title="Dune", author="Frank Herbert", isbn="9780441013593",
+            category=category, total_copies=3, available_copies=3,
+        )
+        cls.member = Member.objects.create(name="Ada", membership_id="M-1", email="ada@example.com")
+        today = now().date()
+        BookIssue.objects.bulk_create([
+            BookIssue(
+                book=cls.book,
+                member=cls.member,
+                due_date=today - timedelta(days=days),
+                return_date=today if days % 2 else None,
+            )
+            for days in range(-10, 30)
+        ])
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # Tiny test tables are cheaper to scan; ask whether an index *can* serve the query.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"expected {index_name} in plan:\n{plan}")
+
+    def test_overdue_scan_uses_partial_index(self):
+        overdue = BookIssue.objects.filter(return_date__isnull=True, due_date__lt=now().date())
+        self.assertUsesIndex(overdue, "bookissue_open_due_idx")
+
+    def test_member_history_uses_member_issue_date_index(self):
+        history = BookIssue.objects.filter(member=self.member).order_by("-issue_date")
+        self.assertUsesIndex(history, "bookissue_member_issued_idx")
+
+    def test_open_loans_per_book_use_book_return_date_index(self):
+        open_loans = BookIssue.objects.filter(book=self.book, return_date__isnull=True)
+        self.assertUsesIndex(open_loans, "bookissue_book_returned_idx")
+
+    def test_member_lookup_by_email_uses_index(self):
+        self.assertUsesIndex(Member.objects.filter(email="ada@example.com"), "member_email_idx")
+
+
+class FineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Fiction")
+        cls.book = Book.objects.create(
+            title="Dune", author="Frank Herbert", isbn="9780441013593",
+            category=category, total_copies=10, available_copies=10,
+        )
+        cls.members = [
+            Member.objects.create(name=name, membership_id=f"M-{name}", email=f"{name}@example.com")
+            for name in ("ada", "bob")
+        ]
+
+    def test_days_between(self):
+        cases = [
+            (date(2024, 3, 1), date(2024, 2, 28), 2),  # leap year
+            (date(2025, 1, 1), date(2024, 12, 31), 1),
+            (date(2024, 6, 15), date(2024, 6, 15), 0),
+            (date(2024, 6, 10), date(2024, 6, 15), -5),
+            (date(2025, 6, 15), date(2024, 6, 15), 365),
+        ]
+        BookIssue.objects.bulk_create([
+            BookIssue(book=self.book, member=self.members[0], due_date=due_date) for _, due_date, _ in cases
+        ])
+        for day, due_date, expected in cases:
+            with self.subTest(day=day, due_date=due_date):
+                days = (
+                    BookIssue.objects
+                    .filter(due_date=due_date)
+                    .annotate(days=DaysBetween(Value(day, output_field=DateField()), F("due_date")))
+                    .values_list("days", flat=True)
+                    .first()
+                )
+                self.assertEqual(days, expected)
+
+    def assertBalancesMatchLoans(self):
+        for member in self.members:
+            total = BookIssue.objects.filter(member=member).aggregate(total=Sum("fine_amount"))["total"]
+            balance = FineBalance.objects.filter(member=member).values_list("balance", flat=True).first()
+            self.assertEqual(balance or 0, total or 0, member)
+
+    def test_balances_follow_accrual_and_returns(self):
+        today = now().date()
+        ada, bob = self.members
+        loans = BookIssue.objects.bulk_create([
+            BookIssue(book=self.book, member=ada, due_date=today - timedelta(days=3)),
+            BookIssue(book=self.book, member=ada, due_date=today - timedelta(days=1)),
+            BookIssue(book=self.book, member=bob, due_date=today - timedelta(days=7)),
+            BookIssue(book=self.book, member=bob, due_date=today + timedelta(days=5)),
+        ])
+
+        self.assertEqual(accrue_fines(today), 3)
+        self.assertEqual(accrue_fines(today), 3)  # idempotent
+        self.assertEqual(FineBalance.objects.get(member=ada).balance, 4 * FINE_PER_DAY)
+        self.assertEqual(FineBalance.objects.get(member=bob).balance, 7 * FINE_PER_DAY)
+        self.assertBalancesMatchLoans()
+
+        return_book(loans[0])
+        self.assertBalancesMatchLoans()
+
+        # Accrued a day early: returning settles the difference.
+        accrue_fines(today - timedelta(days=1))
+        return_books([loans[1].pk, loans[2].pk, loans[3].pk])
+        self.assertBalancesMatchLoans()
+        self.assertEqual(FineBalance.objects.get(member=ada).balance, 4 * FINE_PER_DAY)
+        self.assertEqual(FineBalance.objects.get(member=bob).balance, 7 * FINE_PER_DAY)
+
+
+class BookSavedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fiction, cls.poetry = Category.objects.bulk_create([Category(name="Fiction"), Category(name="Poetry")])
+        Book.objects.create(
+            title="Dune", author="Frank Herbert", isbn="9780441013593",
+            category=cls.fiction, total_copies=1, available_copies=1, embedding=b"vector",
+        )
+
+    def save(self, **changes):
+        book = Book.objects.get()
+        for name, value in changes.items():
+            setattr(book, name, value)
+        with (
+            mock.patch("apps.library.signals.patch_index") as patch_index,
+            mock.patch("apps.library.signals.mark_availability") as mark_availability,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            book.save()
+        return patch_index, mark_availability
+
+    def test_copy_counts_only_move_availability(self):
+        patch_index, mark_availability = self.save(total_copies=2)
+        patch_index.assert_not_called()
+        mark_availability.assert_not_called()
+
+        patch_index, mark_availability = self.save(available_copies=0)
+        patch_index.assert_not_called()
+        mark_availability.assert_called_once_with(Book.objects.get().pk, False)
+
+    def test_vector_changes_patch_the_index(self):
+        for changes in ({"category": self.poetry}, {"embedding": b"other vector"}):
+            with self.subTest(changes=list(changes)):
+                patch_index, _ = self.save(**changes)
+                patch_index.assert_called_once_with([Book.objects.get().pk])
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OverdueNoticeTests(TestCase):
+
+    def test_one_email_per_member_and_none_on_a_rerun(self):
+        category = Category.objects.create(name="Fiction")
+        books = [
+            Book.objects.create(
+                title=title, author="A", isbn=title, category=category, total_copies=5, available_copies=5,
+            )
+            for title in ("Dune", "Emma", "Ulysses")
+        ]
+        ada, bob = [
+            Member.objects.create(name=name, membership_id=f"M-{name}", email=f"{name}@example.com")
+            for name in ("ada", "bob")
+        ]
+        today = now().date()
+        BookIssue.objects.bulk_create([
+            BookIssue(book=books[0], member=ada, due_date=today - timedelta(days=3)),
+            BookIssue(book=books[1], member=ada, due_date=today - timedelta(days=1)),
+            BookIssue(book=books[2], member=ada, due_date=today + timedelta(days=1)),  # not due yet
+            BookIssue(book=books[0], member=bob, due_date=today - timedelta(days=5)),
+            BookIssue(book=books[1], member=bob, due_date=today - timedelta(days=5), return_date=today),
+        ])
+
+        self.assertEqual(send_overdue_notices(today, chunk_size=1), 2)
+
+        emails = {email.to[0]: email.body for email in mail.outbox}
+        self.assertEqual(sorted(emails), ["ada@example.com", "bob@example.com"])
+        self.assertIn("'Dune'", emails["ada@example.com"])
+        self.assertIn("'Emma'", emails["ada@example.com"])
+        self.assertNotIn("'Ulysses'", emails["ada@example.com"])
+        self.assertNotIn("'Emma'", emails["bob@example.com"])
+        self.assertEqual(OverdueNotice.objects.filter(sent_on=today).count(), 3)
+
+        self.assertEqual(send_overdue_notices(today), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+def fake_encode(texts, batch_size=None):
+    return np.stack([np.full(8, len(text), dtype=np.float32) for text in texts])
+
+
+@mock.patch("apps.library.services.patch_index")
+@mock.patch("apps.library.services.encode_texts", side_effect=fake_encode)
+class GenerateEmbeddingsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fiction")
+
+    def add_book(self, isbn, title, author):
+        return Book.objects.create(
+            title=title, author=author, isbn=isbn, category=self.category, total_copies=1, available_copies=1,
+        )
+
+    def test_unchanged_books_are_skipped_and_texts_encoded_once(self, encode_texts, patch_index):
+        self.add_book("1", "Dune", "Frank Herbert")
+        self.add_book("2", "Dune", "Frank Herbert")  # another edition
+        self.add_book("3", "Emma", "Jane Austen")
+
+        self.assertEqual(generate_book_embeddings(), (3, 2))
+        self.assertEqual(sorted(encode_texts.call_args.args[0]), ["Dune Frank Herbert", "Emma Jane Austen"])
+        self.assertFalse(Book.objects.filter(embedding__isnull=True).exists())
+
+        encode_texts.reset_mock()
+        self.assertEqual(generate_book_embeddings(), (0, 0))
+        encode_texts.assert_not_called()
+
+        # A new edition reuses the stored vector instead of re-encoding.
+        book = self.add_book("4", "Emma", "Jane Austen")
+        self.assertEqual(generate_book_embeddings(), (1, 0))
+        encode_texts.assert_not_called()
+        book.refresh_from_db()
+        self.assertEqual(bytes(book.embedding), bytes(Book.objects.get(isbn="3").embedding))
+        patch_index.assert_called_with([book.pk])
+
+
+@mock.patch("apps.library.services.patch_index")
+@mock.patch("apps.library.services.encode_texts", side_effect=fake_encode)
+class AutocompleteTests(TransactionTestCase):
+    """A real transaction per save, so the background rebuild thread sees the books."""
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_prefix_index()
+        self.addCleanup(autocomplete.reset_prefix_index)
+        self.category = Category.objects.create(name="Fiction")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            email="member@example.com", name="Member", password="password123", role=User.Role.MEMBER,
+        ))
+
+    def titles(self, prefix, **params):
+        response = self.client.get(reverse("book-autocomplete"), {"prefix": prefix, **params})
+        return [row["title"] for row in response.data]
+
+    def wait_for_rebuild(self):
+        deadline = time.monotonic() + 5
+        while autocomplete.get_prefix_index().generation != autocomplete.current_generation():
+            self.assertLess(time.monotonic(), deadline, "prefix index was not rebuilt")
+            time.sleep(0.01)
+
+    def book(self, title, author, isbn):
+        return Book(title=title, author=author, isbn=isbn, category=self.category, total_copies=1, available_copies=1)
+
+    def test_prefixes_and_books_added_later(self, encode_texts, patch_index):
+        self.book("Dune", "Frank Herbert", "1").save()
+        self.book("The Dune Encyclopedia", "Willis McNelly", "2").save()
+        self.book("Emma", "Jane Austen", "3").save()
+
+        self.assertEqual(self.titles("DU"), ["Dune", "The Dune Encyclopedia"])  # titles, then later words
+        self.assertEqual(self.titles("jane a"), ["Emma"])
+        self.assertEqual(self.titles("du", limit=1), ["Dune"])
+        self.assertEqual(self.titles(" "), [])
+        self.assertEqual(self.titles("du", limit=0), ["Dune"])  # clamped to 1..20
+        self.assertEqual(self.client.get(reverse("book-autocomplete"), {"prefix": "du", "limit": "x"}).status_code, 400)
+
+        # Saved through the ORM: post_save bumps the generation.
+        self.book("Dune Messiah", "Frank Herbert", "4").save()
+        self.wait_for_rebuild()
+        self.assertEqual(self.titles("dune m"), ["Dune Messiah"])
+
+        # bulk_create()d: picked up once the embedding sweep reaches it.
+        Book.objects.bulk_create([self.book("Children of Dune", "Frank Herbert", "5")])
+        generate_book_embeddings(queryset=Book.objects.filter(embedding_hash=""))
+        self.wait_for_rebuild()
+        self.assertEqual(self.titles("children"), ["Children of Dune"])
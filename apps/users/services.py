@@ -2,9 +2,10 @@ from django.db import transaction
 from apps.users.models import User, ManagementRequest, ManagementProfile
 
 
-from django.core.mail import send_mail
 from django.conf import settings
 
+from apps.core.outbox import enqueue_email
+
 from apps.users.models import ManagementRequest, ManagementProfile
 
 
@@ -36,18 +37,17 @@ def approve_management_request(*, request_id, approved_by):
     req.approved_by = approved_by
     req.save(update_fields=["status", "approved_by"])
 
-    # EMAIL NOTIFICATION
-    send_mail(
+    # EMAIL NOTIFICATION (sent by the outbox dispatcher after commit)
+    enqueue_email(
         subject="Management Request Approved",
-        message=(
+        body=(
             f"Hello {user.name},\n\n"
             f"Your request for the role '{req.requested_role}' has been approved.\n"
             f"You can now access management features.\n\n"
             "Regards,\nLibrary Admin"
         ),
+        to=[user.email],
         from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[user.email],
-        fail_silently=True,
     )
 
 
@@ -119,7 +119,7 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "apps.core.pagination.LimitedPageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_FILTER_BACKENDS": [
         "rest_framework.filters.SearchFilter",
@@ -139,6 +139,127 @@ SIMPLE_JWT = {
 }
 
 
+# Shared by all web and celery workers: the embedding index generation and
+# patches, recommendation caches and task de-duplication keys only work if
+# every process sees the same cache (core.W001 warns otherwise). Defaults to
+# the Redis that CELERY_BROKER_URL assumes, on its own database.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/1"),
+    }
+}
+
+
+# Largest ?page_size= accepted by list endpoints; ?count=true on keyset
+# (cursor) paginated listings caches exact counts for this many seconds.
+PAGINATION_MAX_PAGE_SIZE = 100
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+# Largest batch accepted by /books/issue/bulk/ and /books/return/bulk/.
+CIRCULATION_BULK_MAX_ITEMS = 500
+# A loan gets another overdue reminder at most this often; reminders are
+# sent this many members per SMTP batch.
+OVERDUE_NOTICE_INTERVAL_DAYS = 7
+OVERDUE_NOTICE_CHUNK_SIZE = 100
+# Outbox emails are sent this many per transaction over one SMTP
+# connection, this many seconds after the first is enqueued. Failures are
+# retried after RETRY_DELAY seconds, doubling up to MAX_RETRY_DELAY, and
+# given up on after MAX_ATTEMPTS.
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_DISPATCH_DELAY = 2
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60 * 6
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+# Rows fetched per round trip by the streamed ?format=csv|ndjson reports.
+REPORT_EXPORT_CHUNK_SIZE = 2000
+
+
+# Recommendation engine
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_STORAGE_DTYPE = "float32"  # or "float16" to halve Book.embedding
+EMBEDDING_BATCH_SIZE = 64
+# Load the model at startup instead of on first encode; enable only for
+# processes that embed (e.g. the celery embedding worker).
+EMBEDDING_WARM_UP = os.getenv("EMBEDDING_WARM_UP", "") == "1"
+# Opt-in shared model process (`manage.py run_embedding_server`), e.g.
+# "unix:/run/library/embedding.sock" or "127.0.0.1:8765". Workers fall back to
+# a local model while it is unreachable.
+EMBEDDING_SERVICE_ADDRESS = os.getenv("EMBEDDING_SERVICE_ADDRESS") or None
+EMBEDDING_SERVICE_TIMEOUT = 5.0
+EMBEDDING_INDEX_CHUNK_SIZE = 2000
+# Up to this many changed books are patched into workers' indexes in place;
+# larger changes trigger a full rebuild.
+EMBEDDING_INDEX_PATCH_LIMIT = 5000
+# New/edited books are embedded by a celery task this many seconds after the
+# first save, together with everything else saved in the meantime.
+EMBEDDING_REFRESH_DELAY = 10
+# When set, workers memory-map the index published here by
+# `manage.py export_embedding_index` instead of each loading it from the DB.
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR") or None
+# Book changes are folded into the published index by a celery task this
+# many seconds after the first one (and by a periodic sweep).
+EMBEDDING_INDEX_REPUBLISH_DELAY = 60
+# IVF cells probed per query when the published index carries one (--ann);
+# None uses the value chosen at export time.
+EMBEDDING_ANN_NPROBE = None
+# Scan a compressed copy of the matrix ("int8" or "float16") and re-score
+# top_k * EMBEDDING_RERANK_FACTOR candidates at full precision. None scans
+# the float32 rows directly; `scripts/benchmark_quantization.py` compares them.
+EMBEDDING_INDEX_QUANTIZATION = os.getenv("EMBEDDING_INDEX_QUANTIZATION") or None
+EMBEDDING_RERANK_FACTOR = 10
+RECOMMENDATION_CACHE_TIMEOUT = 60 * 60
+# Share of the final score taken from item-item co-borrowing (0 disables it),
+# how many content candidates per result are re-scored, and how many
+# neighbours are kept per book.
+RECOMMENDATION_CF_WEIGHT = 0.3
+RECOMMENDATION_CF_CANDIDATES = 5
+RECOMMENDATION_CF_NEIGHBOURS = 50
+# Most recent distinct loans kept per member (MemberTaste.book_ids): the
+# books co-borrowing is scored from and excluded from their recommendations.
+RECOMMENDATION_HISTORY_SIZE = 200
+SEMANTIC_SEARCH_QUERY_CACHE_SIZE = 2048
+# Seconds clients may reuse /books/autocomplete/ responses.
+AUTOCOMPLETE_MAX_AGE = 30
+
+
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    "materialize-member-recommendations": {
+        "task": "apps.ai_engine.tasks.materialize_member_recommendations",
+        "schedule": timedelta(days=1),
+    },
+    "refresh-item-neighbours": {
+        "task": "apps.ai_engine.tasks.refresh_item_neighbours",
+        "schedule": timedelta(hours=1),
+    },
+    "rebuild-item-neighbours": {
+        "task": "apps.ai_engine.tasks.build_item_neighbours",
+        "schedule": timedelta(days=1),
+    },
+    "accrue-fines": {
+        "task": "apps.library.tasks.accrue_fines",
+        "schedule": timedelta(days=1),
+    },
+    "send-overdue-reminders": {
+        "task": "apps.ai_engine.tasks.send_overdue_reminders",
+        "schedule": timedelta(days=1),
+    },
+    # Books whose kick was lost or that were bulk_create()d (no signal).
+    "embed-pending-books": {
+        "task": "apps.ai_engine.tasks.embed_pending_books",
+        "schedule": timedelta(minutes=10),
+    },
+    "republish-embedding-index": {
+        "task": "apps.ai_engine.tasks.republish_embedding_index",
+        "schedule": timedelta(minutes=5),
+    },
+    "dispatch-email-outbox": {
+        "task": "apps.core.tasks.dispatch_email_outbox",
+        "schedule": timedelta(minutes=1),
+    },
+}
 
 
 # Password validation
@@ -0,0 +1,100 @@
+# Recall-vs-latency benchmark: IVFIndex against brute-force cosine scoring.
+#
+#   python scripts/benchmark_ann.py --books 400000 --dim 384
+#   python scripts/benchmark_ann.py --from-db          # use Book.embedding rows
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps.ai_engine.embeddings import normalize
+from apps.ai_engine.recommender import IVFIndex
+
+
+def synthetic_catalogue(n, dim, topics, seed=0):
+    """Clustered unit vectors, closer to real title embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    labels = rng.integers(topics, size=n)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return np.arange(1, n + 1, dtype=np.int64), normalize(vectors)
+
+
+def catalogue_from_db():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_lms.settings")
+    import django
+    django.setup()
+
+    from apps.ai_engine.index import EmbeddingIndex
+
+    index = EmbeddingIndex.build()
+    return index.ids, np.asarray(index.matrix)
+
+
+def brute_force(matrix, query, k):
+    scores = matrix @ query
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def timed(fn, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVFIndex recall and latency against brute force.")
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--from-db", action="store_true")
+    args = parser.parse_args()
+
+    if args.from_db:
+        ids, matrix = catalogue_from_db()
+    else:
+        ids, matrix = synthetic_catalogue(args.books, args.dim, args.topics)
+
+    rng = np.random.default_rng(1)
+    queries = normalize(
+        matrix[rng.choice(len(matrix), args.queries)]
+        + 0.1 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32)
+    )
+    k = args.top_k
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(ids, matrix, n_lists=args.n_lists)
+    build_seconds = time.perf_counter() - start
+    print(f"{len(ids)} vectors x {matrix.shape[1]} dims, {ivf.n_lists} IVF lists, built in {build_seconds:.1f}s")
+
+    exact, latencies = timed(lambda q: ids[brute_force(matrix, q, k)], queries)
+    print(f"\n{'method':<14}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'brute force':<14}{1.0:>10.3f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}")
+
+    for nprobe in args.nprobe:
+        if nprobe > ivf.n_lists:
+            break
+        found, latencies = timed(lambda q: ivf.search(q, top_k=k, nprobe=nprobe)[0], queries)
+        recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, exact)])
+        print(
+            f"{'ivf nprobe=' + str(nprobe):<14}{recall:>10.3f}"
+            f"{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
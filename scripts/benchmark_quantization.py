@@ -0,0 +1,73 @@
+# Memory, latency and recall of quantized scanning against the float32 scan
+# that recommend_books_for_member uses today.
+#
+#   python scripts/benchmark_quantization.py --books 1000000 --dim 384
+#   python scripts/benchmark_quantization.py --from-db --rerank 5 10 20
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps.ai_engine.embeddings import normalize
+from apps.ai_engine.quantization import KINDS, QuantizedMatrix
+from benchmark_ann import brute_force, catalogue_from_db, synthetic_catalogue, timed
+
+
+def rerank_search(ids, matrix, scan, query, k, factor):
+    """Same steps as ``EmbeddingIndex.search`` with a scan matrix."""
+    scores = scan.scores(query)
+    pool = min(k * factor, len(scores))
+    candidates = np.sort(np.argpartition(-scores, pool - 1)[:pool])
+    exact = matrix[candidates] @ query
+    best = np.argpartition(-exact, k - 1)[:k]
+    return ids[candidates[best[np.argsort(-exact[best])]]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized scan + exact re-rank against float32 brute force.")
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--from-db", action="store_true")
+    args = parser.parse_args()
+
+    if args.from_db:
+        ids, matrix = catalogue_from_db()
+    else:
+        ids, matrix = synthetic_catalogue(args.books, args.dim, args.topics)
+
+    rng = np.random.default_rng(1)
+    queries = normalize(
+        matrix[rng.choice(len(matrix), args.queries)]
+        + 0.1 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32)
+    )
+    k = args.top_k
+    print(f"{len(ids)} vectors x {matrix.shape[1]} dims")
+
+    exact, latencies = timed(lambda q: ids[brute_force(matrix, q, k)], queries)
+    print(f"\n{'method':<18}{'scan MB':>10}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(
+        f"{'float32':<18}{matrix.nbytes / 2**20:>10.1f}{1.0:>10.3f}"
+        f"{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+    )
+
+    for kind in KINDS:
+        scan = QuantizedMatrix.from_vectors(matrix, kind)
+        for factor in args.rerank:
+            found, latencies = timed(lambda q: rerank_search(ids, matrix, scan, q, k, factor), queries)
+            recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, exact)])
+            print(
+                f"{kind + ' x' + str(factor):<18}{scan.nbytes / 2**20:>10.1f}{recall:>10.3f}"
+                f"{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Concurrent checkout/return load test against one popular title.
+#
+# Runs issue_book/return_book from many threads on the configured database
+# (use PostgreSQL; SQLite serialises writers) and checks that no more loans
+# are created than there are copies.
+#
+#   python scripts/load_test_checkout.py --clients 300 --copies 20
+#   python scripts/load_test_checkout.py --clients 300 --copies 20 --rounds 5
+
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_lms.settings")
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from apps.library.models import Book, BookIssue, Category, Member
+from apps.library.services import issue_book, return_book
+
+
+def create_fixture(clients, copies):
+    tag = uuid.uuid4().hex[:8]
+    category, _ = Category.objects.get_or_create(name="Load test")
+    book = Book.objects.create(
+        title=f"Load test {tag}",
+        author="Load test",
+        isbn=f"LT{tag}",
+        category=category,
+        total_copies=copies,
+        available_copies=copies,
+    )
+    members = Member.objects.bulk_create(
+        Member(name=f"Load test {i}", membership_id=f"LT{tag}-{i}", email=f"lt{tag}-{i}@example.com")
+        for i in range(clients)
+    )
+    return book, members
+
+
+def run_round(book_id, members):
+    """Every member tries to borrow at once; returns (loans, rejected, latencies)."""
+    barrier = threading.Barrier(len(members))
+    lock = threading.Lock()
+    loans, rejected, latencies = [], [0], []
+
+    def client(member):
+        try:
+            book = Book.objects.get(pk=book_id)
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                issue = issue_book(book, member)
+            except ValueError:
+                with lock:
+                    rejected[0] += 1
+            else:
+                with lock:
+                    loans.append(issue)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client, args=(member,)) for member in members]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return loans, rejected[0], latencies
+
+
+def return_all(loans):
+    def client(issue):
+        try:
+            return_book(issue)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client, args=(issue,)) for issue in loans]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer issue_book/return_book on one title from many threads.")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="Leave the test book, members and loans in place.")
+    args = parser.parse_args()
+
+    book, members = create_fixture(args.clients, args.copies)
+    print(f"{args.clients} clients, {args.copies} copies of book {book.pk}, {connection.vendor}")
+    failures = 0
+
+    try:
+        for round_number in range(1, args.rounds + 1):
+            start = time.perf_counter()
+            loans, rejected, latencies = run_round(book.pk, members)
+            elapsed = time.perf_counter() - start
+
+            book.refresh_from_db()
+            open_loans = BookIssue.objects.filter(book=book, return_date__isnull=True).count()
+            ok = len(loans) == args.copies and open_loans == args.copies and book.available_copies == 0
+            failures += not ok
+
+            latencies.sort()
+            print(
+                f"round {round_number}: {len(loans)} issued, {rejected} rejected, "
+                f"{open_loans} open loans, {book.available_copies} left; "
+                f"{len(members) / elapsed:.0f} req/s, "
+                f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms "
+                f"{'OK' if ok else 'FAILED'}"
+            )
+
+            return_all(loans)
+            book.refresh_from_db()
+            if book.available_copies != args.copies:
+                failures += 1
+                print(f"  after returns: {book.available_copies} available, expected {args.copies} FAILED")
+    finally:
+        if not args.keep:
+            BookIssue.objects.filter(book=book).delete()
+            Member.objects.filter(pk__in=[member.pk for member in members]).delete()
+            book.delete()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,15 @@
 
 import os
 import django
-import pickle
-from sentence_transformers import SentenceTransformer
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_lms.settings")
 django.setup()  # MUST be called before importing models
 
 from apps.library.models import Category, Book
+from apps.ai_engine.embeddings import encode_embedding
+from apps.ai_engine.encoder import encode_texts
 from apps.users.models import User, MemberProfile
 
-# optional: embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
 # Seed categories
 categories = ["Science Fiction", "Fantasy", "History", "Technology", "Mathematics"]
 for cat_name in categories:
@@ -39,8 +36,8 @@ for book_data in books_data:
         defaults={"total_copies": book_data["total_copies"], "available_copies": book_data["total_copies"]},
     )
     # embeddings
-    emb = model.encode(book.title + " " + book.author)
-    book.embedding = pickle.dumps(emb)
+    emb = encode_texts([book.title + " " + book.author])[0]
+    book.embedding = encode_embedding(emb)
     book.save()
 
 # Seed members
@@ -1,5 +1,13 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import now
 from rest_framework import status
 from rest_framework.test import APIClient
 from apps.library.models import Book, Category, BookIssue, Member
@@ -82,6 +90,106 @@ class LMSAPITestCase(TestCase):
         with self.assertRaisesMessage(ValueError, "No copies available"):
             issue_book(book, self.member)
 
+    # Test the conditional UPDATE rejects a checkout once copies run out,
+    # even for a caller holding a stale Book instance
+    def test_issue_book_stops_at_zero_copies(self):
+        book = self._create_dummy_book(copies=1)
+        stale = Book.objects.get(pk=book.pk)
+        issue_book(book, self.member)
+        with self.assertRaisesMessage(ValueError, "No copies available"):
+            issue_book(stale, self.member)
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(BookIssue.objects.filter(book=book).count(), 1)
+
+    # Test the copy counter is decremented last, so the book row stays
+    # locked only from that UPDATE to commit
+    def test_issue_book_locks_book_last(self):
+        book = self._create_dummy_book(copies=1)
+        with CaptureQueriesContext(connection) as queries:
+            issue_book(book, self.member)
+        writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertTrue(writes[-1].startswith('UPDATE "library_book"'), writes)
+
+    # Test returning the same loan twice raises and restocks only once
+    def test_second_return_rejected(self):
+        book = self._create_dummy_book(copies=2)
+        issue = issue_book(book, self.member)
+        stale = BookIssue.objects.get(pk=issue.pk)
+        return_book(issue)
+        with self.assertRaisesMessage(ValueError, "Book already returned"):
+            return_book(stale)
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 2)
+
+    # Test bulk issue hands out copies in request order and reports
+    # per-item errors
+    def test_bulk_issue_earlier_items_first(self):
+        self.client.force_authenticate(user=self.librarian_user)
+        book = self._create_dummy_book(copies=2)
+        other = Member.objects.create(name="Other", email="other@example.com", membership_id="MEM-OTHER")
+        items = [
+            {"book_id": book.id, "member_id": self.member.id},
+            {"book_id": book.id, "member_id": other.id},
+            {"book_id": book.id, "member_id": self.member.id},
+            {"book_id": 999999, "member_id": self.member.id},
+            {"book_id": book.id, "member_id": 999999},
+        ]
+        response = self.client.post(reverse("issue-book-bulk"), {"items": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [result.get("error") for result in results],
+            [None, None, "No copies available", "Book not found", "Member not found"],
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(BookIssue.objects.filter(book=book).count(), 2)
+
+    # Test bulk return closes each loan once and reports duplicates and
+    # unknown ids per item
+    def test_bulk_return_duplicates_and_unknown_ids(self):
+        self.client.force_authenticate(user=self.librarian_user)
+        book = self._create_dummy_book(copies=2)
+        first = issue_book(book, self.member)
+        second = issue_book(book, self.member)
+        issue_ids = [first.id, first.id, second.id, 999999]
+        response = self.client.post(reverse("return-book-bulk"), {"issue_ids": issue_ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result.get("error") for result in response.data["results"]],
+            [None, "Book already returned", None, "Issue not found"],
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 2)
+
+        response = self.client.post(reverse("return-book-bulk"), {"issue_ids": [first.id]}, format="json")
+        self.assertEqual(response.data["results"][0]["error"], "Book already returned")
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 2)
+
+    # Test bulk endpoints reject malformed or oversized payloads
+    @override_settings(CIRCULATION_BULK_MAX_ITEMS=2)
+    def test_bulk_bad_payloads(self):
+        self.client.force_authenticate(user=self.librarian_user)
+        bad = [
+            ("issue-book-bulk", {}),
+            ("issue-book-bulk", {"items": []}),
+            ("issue-book-bulk", {"items": {"book_id": 1, "member_id": 1}}),
+            ("issue-book-bulk", {"items": [{"book_id": 1}]}),
+            ("issue-book-bulk", {"items": [{"book_id": "x", "member_id": 1}]}),
+            ("issue-book-bulk", {"items": [{"book_id": 1, "member_id": 1}] * 3}),
+            ("return-book-bulk", {}),
+            ("return-book-bulk", {"issue_ids": []}),
+            ("return-book-bulk", {"issue_ids": ["x"]}),
+            ("return-book-bulk", {"issue_ids": [1, 2, 3]}),
+        ]
+        for name, payload in bad:
+            with self.subTest(name=name, payload=payload):
+                response = self.client.post(reverse(name), payload, format="json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BookIssue.objects.exists())
+
     # Test management request creation and approval
     def test_management_request_and_approval(self):
         # Create a management request
@@ -110,3 +218,39 @@ class LMSAPITestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)  # Should return a list of books
+
+    # Test each loan report streams CSV and NDJSON with its own rows
+    def test_loan_reports_stream_csv_and_ndjson(self):
+        self.client.force_authenticate(user=self.librarian_user)
+        book = self._create_dummy_book(copies=3)
+        today = now().date()
+        overdue, active, returned = [
+            BookIssue.objects.create(book=book, member=self.member, due_date=today + timedelta(days=days))
+            for days in (-2, 5, -1)
+        ]
+        BookIssue.objects.filter(pk=returned.pk).update(
+            issue_date=today - timedelta(days=30), return_date=today - timedelta(days=20),
+        )
+
+        reports = [
+            ("overdue-report", {}, [overdue.pk]),
+            ("active-loan-report", {}, [overdue.pk, active.pk]),
+            ("circulation-report", {}, [returned.pk, overdue.pk, active.pk]),
+            ("circulation-report", {"from": str(today - timedelta(days=7))}, [overdue.pk, active.pk]),
+        ]
+        for name, params, expected in reports:
+            for export_format, content_type in (("csv", "text/csv"), ("ndjson", "application/x-ndjson")):
+                with self.subTest(report=name, params=params, format=export_format):
+                    response = self.client.get(reverse(name), {**params, "format": export_format})
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertTrue(response.streaming)
+                    self.assertEqual(response["Content-Type"], content_type)
+                    self.assertIn(f".{export_format}", response["Content-Disposition"])
+
+                    content = b"".join(response.streaming_content).decode()
+                    if export_format == "csv":
+                        rows = list(csv.DictReader(io.StringIO(content)))
+                    else:
+                        rows = [json.loads(line) for line in content.splitlines()]
+                    self.assertEqual([int(row["id"]) for row in rows], expected)
+                    self.assertEqual(rows[0]["book__isbn"], book.isbn)